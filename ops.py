@@ -4,10 +4,12 @@
 
 # src/utils/op.py
 
-from torch.nn.utils import spectral_norm
+from torch.nn.utils import spectral_norm as torch_spectral_norm, remove_spectral_norm
+from torch.nn.utils.spectral_norm import SpectralNorm
 from torch.nn import init
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import numpy as np
 
 def linear(in_features, out_features, bias=True):
@@ -115,6 +117,9 @@ class LeCamEMA(object):
         self.start_itr = start_iter
 
     def update(self, cur, mode, itr):
+        if torch.is_tensor(cur):
+            # device tensors stay on device (the EMAs become tensors), no host sync per update
+            cur = cur.detach()
         if itr < self.start_itr:
             decay = 0.0
         else:
@@ -191,7 +196,97 @@ def embedding(num_embeddings, embedding_dim):
     return nn.Embedding(num_embeddings=num_embeddings, embedding_dim=embedding_dim)
 
 
-def snconv2d(in_channels, out_channels, kernel_size, stride=1, padding=0, dilation=1, groups=1, bias=True):
+# same implementation as src/models/spectral_norm.py: root ops.py is used without src/ on the path,
+# so it stays self-contained, change both together
+class StepSpectralNorm(SpectralNorm):
+    """
+    SpectralNorm hook that runs the power iteration once per optimizer step instead of on every forward.
+
+    An update of the weight (optimizer.step, clipping, load_state_dict) bumps its version counter; the
+    first training forward after it refreshes u / v with n_power_iterations steps, every interval-th
+    update only. The other forwards of the step (D(real), D(fake), the G step) reuse u / v: with
+    gradients, sigma = u^T W v is recomputed (one matrix-vector product) so it still backpropagates
+    into W, without gradients (frozen D, no_grad, eval) W / sigma is cached until W or u changes.
+    Parameters and buffers are the ones of torch.nn.utils.spectral_norm, checkpoints are interchangeable.
+    """
+
+    def __init__(self, name='weight', n_power_iterations=1, dim=0, eps=1e-12, interval=1):
+        super(StepSpectralNorm, self).__init__(name, n_power_iterations, dim, eps)
+        self.interval = interval
+        self.num_updates = 0
+        self.weight_key = None
+        self.cache = None
+        self.cache_key = None
+
+    @staticmethod
+    def _key(tensor):
+        # storage and in-place version: changes on optimizer steps, copies and .to()
+        return tensor.data_ptr(), tensor._version
+
+    def power_iteration(self, module):
+        weight_mat = self.reshape_weight_to_matrix(getattr(module, self.name + '_orig'))
+        u = getattr(module, self.name + '_u')
+        v = getattr(module, self.name + '_v')
+        with torch.no_grad():
+            for _ in range(self.n_power_iterations):
+                # in place, see SpectralNorm.compute_weight for DataParallel
+                F.normalize(torch.mv(weight_mat.t(), u), dim=0, eps=self.eps, out=v)
+                F.normalize(torch.mv(weight_mat, v), dim=0, eps=self.eps, out=u)
+
+    def normalized_weight(self, module):
+        weight = getattr(module, self.name + '_orig')
+        # cloned so that a later power iteration does not invalidate this graph
+        u = getattr(module, self.name + '_u').clone(memory_format=torch.contiguous_format)
+        v = getattr(module, self.name + '_v').clone(memory_format=torch.contiguous_format)
+        sigma = torch.dot(u, torch.mv(self.reshape_weight_to_matrix(weight), v))
+        return weight / sigma
+
+    def __call__(self, module, inputs):
+        weight = getattr(module, self.name + '_orig')
+        weight_key = self._key(weight)
+        if module.training and weight_key != self.weight_key:
+            if self.num_updates % self.interval == 0:
+                self.power_iteration(module)
+            self.num_updates += 1
+            self.weight_key = weight_key
+
+        if torch.is_grad_enabled() and weight.requires_grad:
+            setattr(module, self.name, self.normalized_weight(module))
+            return
+
+        cache_key = weight_key + self._key(getattr(module, self.name + '_u'))
+        if self.cache is None or cache_key != self.cache_key:
+            with torch.no_grad():
+                self.cache = self.normalized_weight(module)
+            self.cache_key = cache_key
+        setattr(module, self.name, self.cache)
+
+
+def spectral_norm(module, name='weight', n_power_iterations=1, eps=1e-12, dim=None, interval=1):
+    """torch.nn.utils.spectral_norm with the power iteration run once every interval optimizer steps."""
+    torch_spectral_norm(module, name, n_power_iterations, eps, dim)
+    for key, hook in module._forward_pre_hooks.items():
+        if isinstance(hook, SpectralNorm) and hook.name == name:
+            module._forward_pre_hooks[key] = StepSpectralNorm(hook.name, hook.n_power_iterations, hook.dim,
+                                                              hook.eps, interval)
+    return module
+
+
+def freeze_spectral_norm(module):
+    """
+    Frozen inference mode: bakes W / sigma (current u, v) into a plain weight parameter of every
+    spectral-normalized layer of module and removes the hooks, the forward is then a plain conv / linear.
+    The state dict has the keys of the model without spectral norm.
+    """
+    for child in module.modules():
+        names = [hook.name for hook in child._forward_pre_hooks.values() if isinstance(hook, SpectralNorm)]
+        for name in names:
+            remove_spectral_norm(child, name)
+    return module
+
+
+def snconv2d(in_channels, out_channels, kernel_size, stride=1, padding=0, dilation=1, groups=1, bias=True,
+             n_power_iterations=1, interval=1):
     return spectral_norm(nn.Conv2d(in_channels=in_channels,
                                    out_channels=out_channels,
                                    kernel_size=kernel_size,
@@ -200,10 +295,11 @@ def snconv2d(in_channels, out_channels, kernel_size, stride=1, padding=0, dilati
                                    dilation=dilation,
                                    groups=groups,
                                    bias=bias),
-                         eps=1e-6)
+                         eps=1e-6, n_power_iterations=n_power_iterations, interval=interval)
 
 
-def sndeconv2d(in_channels, out_channels, kernel_size, stride=2, padding=0, dilation=1, groups=1, bias=True):
+def sndeconv2d(in_channels, out_channels, kernel_size, stride=2, padding=0, dilation=1, groups=1, bias=True,
+               n_power_iterations=1, interval=1):
     return spectral_norm(nn.ConvTranspose2d(in_channels=in_channels,
                                             out_channels=out_channels,
                                             kernel_size=kernel_size,
@@ -212,11 +308,12 @@ def sndeconv2d(in_channels, out_channels, kernel_size, stride=2, padding=0, dila
                                             dilation=dilation,
                                             groups=groups,
                                             bias=bias),
-                         eps=1e-6)
+                         eps=1e-6, n_power_iterations=n_power_iterations, interval=interval)
 
 
-def snlinear(in_features, out_features, bias=True):
-    return spectral_norm(nn.Linear(in_features=in_features, out_features=out_features, bias=bias), eps=1e-6)
+def snlinear(in_features, out_features, bias=True, n_power_iterations=1, interval=1):
+    return spectral_norm(nn.Linear(in_features=in_features, out_features=out_features, bias=bias), eps=1e-6,
+                         n_power_iterations=n_power_iterations, interval=interval)
 
 
 def sn_embedding(num_embeddings, embedding_dim):
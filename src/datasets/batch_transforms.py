@@ -0,0 +1,247 @@
+import math
+import torch
+import torch.nn.functional as F
+
+
+# Batched counterparts of the torchvision augmentations used in this repo.
+# They take a whole (N, C, H, W) batch in [0, 255] (uint8 or float, on any device), draw the
+# random parameters of every image at once and apply them with a handful of tensor ops.
+# Geometric transforms keep the dtype, color transforms return float.
+# They plug into InMemoryImageDataset(transform=...) or can be called on a batch already on the GPU.
+
+
+def _random_mask(n, p, device):
+    return torch.rand(n, device=device) < p
+
+
+class BatchCompose:
+    def __init__(self, transforms):
+        self.transforms = transforms
+
+    def __call__(self, images):
+        for t in self.transforms:
+            images = t(images)
+        return images
+
+    def __repr__(self):
+        return self.__class__.__name__ + '(' + ''.join('\n    {}'.format(t) for t in self.transforms) + '\n)'
+
+
+class BatchRandomApply:
+    def __init__(self, transform, p=0.5):
+        self.transform = transform
+        self.p = p
+
+    def __call__(self, images):
+        mask = _random_mask(images.size(0), self.p, images.device).view(-1, 1, 1, 1)
+        out = self.transform(images)
+        return torch.where(mask, out, images.to(out.dtype))
+
+    def __repr__(self):
+        return '{}({}, p={})'.format(self.__class__.__name__, self.transform, self.p)
+
+
+class BatchRandomCrop:
+    """RandomCrop(size, padding) with zero padding: pad the batch once and gather one window per image."""
+
+    def __init__(self, size, padding=0):
+        self.size = size
+        self.padding = padding
+
+    def __call__(self, images):
+        N, C, H, W = images.size()
+        p = self.padding
+        if p > 0:
+            images = F.pad(images, (p, p, p, p))
+        top = torch.randint(0, H + 2 * p - self.size + 1, (N, 1), device=images.device)
+        left = torch.randint(0, W + 2 * p - self.size + 1, (N, 1), device=images.device)
+        offset = torch.arange(self.size, device=images.device)
+        rows = (top + offset).view(N, 1, self.size, 1)
+        cols = (left + offset).view(N, 1, 1, self.size)
+        n = torch.arange(N, device=images.device).view(N, 1, 1, 1)
+        c = torch.arange(C, device=images.device).view(1, C, 1, 1)
+        return images[n, c, rows, cols]
+
+    def __repr__(self):
+        return '{}(size={}, padding={})'.format(self.__class__.__name__, self.size, self.padding)
+
+
+class BatchRandomHorizontalFlip:
+    def __init__(self, p=0.5):
+        self.p = p
+
+    def __call__(self, images):
+        mask = _random_mask(images.size(0), self.p, images.device).view(-1, 1, 1, 1)
+        return torch.where(mask, images.flip(-1), images)
+
+    def __repr__(self):
+        return '{}(p={})'.format(self.__class__.__name__, self.p)
+
+
+def _affine(images, theta, mode):
+    grid = F.affine_grid(theta, list(images.size()), align_corners=False)
+    out = F.grid_sample(images.float(), grid, mode=mode, padding_mode='zeros', align_corners=False)
+    if images.dtype == torch.uint8:
+        out = out.round_().clamp_(0, 255).to(torch.uint8)
+    return out
+
+
+class BatchRandomRotation:
+    """RandomRotation(degrees) through one affine_grid / grid_sample call, nearest sampling and zero fill."""
+
+    def __init__(self, degrees, mode='nearest'):
+        self.degrees = (-degrees, degrees) if isinstance(degrees, (int, float)) else tuple(degrees)
+        self.mode = mode
+
+    def __call__(self, images):
+        N, _, H, W = images.size()
+        angle = torch.empty(N, device=images.device).uniform_(*self.degrees) * (math.pi / 180.)
+        cos, sin = torch.cos(angle), torch.sin(angle)
+        theta = torch.zeros(N, 2, 3, device=images.device)
+        # grid coordinates are normalized per axis, so the aspect ratio has to be folded in
+        theta[:, 0, 0] = cos
+        theta[:, 0, 1] = -sin * H / W
+        theta[:, 1, 0] = sin * W / H
+        theta[:, 1, 1] = cos
+        return _affine(images, theta, self.mode)
+
+    def __repr__(self):
+        return '{}(degrees={})'.format(self.__class__.__name__, self.degrees)
+
+
+class BatchRandomResizedCrop:
+    """RandomResizedCrop(size, scale, ratio) as one affine_grid / grid_sample call with bilinear sampling."""
+
+    def __init__(self, size, scale=(0.08, 1.0), ratio=(3. / 4., 4. / 3.)):
+        self.size = size
+        self.scale = scale
+        self.ratio = ratio
+
+    def __call__(self, images):
+        N = images.size(0)
+        device = images.device
+        area = torch.empty(N, device=device).uniform_(*self.scale)
+        log_ratio = torch.empty(N, device=device).uniform_(math.log(self.ratio[0]), math.log(self.ratio[1]))
+        ratio = torch.exp(log_ratio)
+        # crop width / height as a fraction of the image
+        w = torch.sqrt(area * ratio).clamp_(max=1.)
+        h = torch.sqrt(area / ratio).clamp_(max=1.)
+        cx = (torch.rand(N, device=device) * 2 - 1) * (1 - w)
+        cy = (torch.rand(N, device=device) * 2 - 1) * (1 - h)
+
+        theta = torch.zeros(N, 2, 3, device=device)
+        theta[:, 0, 0] = w
+        theta[:, 0, 2] = cx
+        theta[:, 1, 1] = h
+        theta[:, 1, 2] = cy
+        grid = F.affine_grid(theta, [N, images.size(1), self.size, self.size], align_corners=False)
+        out = F.grid_sample(images.float(), grid, mode='bilinear', padding_mode='border', align_corners=False)
+        if images.dtype == torch.uint8:
+            out = out.round_().clamp_(0, 255).to(torch.uint8)
+        return out
+
+    def __repr__(self):
+        return '{}(size={}, scale={}, ratio={})'.format(self.__class__.__name__, self.size, self.scale, self.ratio)
+
+
+def _grayscale(images):
+    if images.size(1) == 1:
+        return images
+    r, g, b = images.unbind(1)
+    return (0.299 * r + 0.587 * g + 0.114 * b).unsqueeze(1)
+
+
+def _blend(images, other, factor):
+    return (factor * images + (1 - factor) * other).clamp_(0, 255)
+
+
+def _factor(value, n, device, center=1.):
+    if value == 0:
+        return None
+    low, high = max(0., center - value), center + value
+    return torch.empty(n, 1, 1, 1, device=device).uniform_(low, high)
+
+
+class BatchColorJitter:
+    """
+    ColorJitter(brightness, contrast, saturation, hue) with one random factor per image.
+    The four adjustments are applied in a fixed order and the hue shift is a rotation of the
+    chroma plane in YIQ space, a cheap stand-in for torchvision's HSV round trip.
+    """
+
+    def __init__(self, brightness=0., contrast=0., saturation=0., hue=0.):
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.hue = hue
+
+    def __call__(self, images):
+        images = images.float()
+        N = images.size(0)
+        device = images.device
+
+        factor = _factor(self.brightness, N, device)
+        if factor is not None:
+            images = (images * factor).clamp_(0, 255)
+
+        factor = _factor(self.contrast, N, device)
+        if factor is not None:
+            mean = _grayscale(images).mean(dim=(1, 2, 3), keepdim=True)
+            images = _blend(images, mean, factor)
+
+        factor = _factor(self.saturation, N, device)
+        if factor is not None and images.size(1) == 3:
+            images = _blend(images, _grayscale(images), factor)
+
+        if self.hue > 0 and images.size(1) == 3:
+            angle = torch.empty(N, device=device).uniform_(-self.hue, self.hue) * (2 * math.pi)
+            images = self._rotate_hue(images, angle)
+        return images
+
+    @staticmethod
+    def _rotate_hue(images, angle):
+        rgb2yiq = images.new_tensor([[0.299, 0.587, 0.114],
+                                     [0.596, -0.274, -0.322],
+                                     [0.211, -0.523, 0.312]])
+        yiq2rgb = torch.linalg.inv(rgb2yiq)
+        cos, sin = torch.cos(angle), torch.sin(angle)
+        rotation = torch.zeros(angle.size(0), 3, 3, device=images.device)
+        rotation[:, 0, 0] = 1
+        rotation[:, 1, 1] = cos
+        rotation[:, 1, 2] = -sin
+        rotation[:, 2, 1] = sin
+        rotation[:, 2, 2] = cos
+        # one 3x3 color matrix per image
+        matrix = yiq2rgb @ rotation @ rgb2yiq
+        out = torch.einsum('nij,njhw->nihw', matrix, images)
+        return out.clamp_(0, 255)
+
+    def __repr__(self):
+        return '{}(brightness={}, contrast={}, saturation={}, hue={})'.format(
+            self.__class__.__name__, self.brightness, self.contrast, self.saturation, self.hue)
+
+
+class BatchRandomGrayscale:
+    def __init__(self, p=0.1):
+        self.p = p
+
+    def __call__(self, images):
+        mask = _random_mask(images.size(0), self.p, images.device).view(-1, 1, 1, 1)
+        gray = _grayscale(images.float()).expand_as(images)
+        return torch.where(mask, gray, images.float())
+
+    def __repr__(self):
+        return '{}(p={})'.format(self.__class__.__name__, self.p)
+
+
+class BatchTwoCrop:
+    """Two independently augmented views of the same batch (TwoCropTransform for batches)."""
+
+    def __init__(self, transform):
+        self.transform = transform
+
+    def __call__(self, images):
+        return [self.transform(images), self.transform(images)]
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.transform)
@@ -0,0 +1,111 @@
+import os
+import json
+import numpy as np
+from PIL import Image
+from torch.utils.data import Dataset
+from torchvision import transforms
+from datasets.class_index import ClassIndex
+from datasets.stats import load_or_compute_stats
+
+
+def cache_key(dataset, imb_type='exp', imb_factor=0.01, rand_number=0, reverse=False, image_size=None, train=True):
+    return '{}_{}_{}_{}_{}_{}_{}'.format(dataset, 'train' if train else 'test', imb_type, imb_factor,
+                                         rand_number, 'reverse' if reverse else 'forward', image_size)
+
+
+def _save_atomic(path, array):
+    # per-process tmp name, concurrent builders of the same key never write into one file
+    tmp = path + '.{}.tmp.npy'.format(os.getpid())
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+def _resize(data, image_size):
+    # same PIL bilinear Resize the transforms used to apply on every access, applied once
+    resize = transforms.Resize(image_size)
+    return np.stack([np.asarray(resize(Image.fromarray(image))) for image in data])
+
+
+class CachedImageDataset(Dataset):
+    """
+    Subsetted (and resized) uint8 images + int64 targets of an imbalanced dataset stored as a .npy pair
+    under cache_dir/<key>/ and opened memory-mapped, so every run and every DataLoader worker shares the
+    same page cache instead of rebuilding the subset from the raw torchvision files.
+
+    Same interface as the Imbalanced_* datasets: data, targets, get_cls_num_list and PIL based transform.
+    The ClassIndex of the targets is stored with the entry and loaded as class_index, the per-channel
+    mean / std of the subset are computed on the first stats() call and kept with it as well.
+    """
+
+    def __init__(self, path, transform=None, target_transform=None):
+        self.path = path
+        self.data = np.load(os.path.join(path, 'data.npy'), mmap_mode='r')
+        self.targets = np.load(os.path.join(path, 'targets.npy'), mmap_mode='r')
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if os.path.exists(os.path.join(path, ClassIndex.FILENAME)):
+            self.class_index = ClassIndex.load(path)
+        else:
+            self.class_index = ClassIndex.from_targets(self.targets)
+        self.transform = transform
+        self.target_transform = target_transform
+
+    @classmethod
+    def load_or_build(cls, dataset_cls, root, cache_dir=None, imb_type='exp', imb_factor=0.01, rand_number=0,
+                      reverse=False, image_size=None, train=True, transform=None, target_transform=None):
+        root = os.path.expanduser(root)
+        cache_dir = os.path.join(root, 'cache') if cache_dir is None else os.path.expanduser(cache_dir)
+        key = cache_key(dataset_cls.__name__, imb_type, imb_factor, rand_number, reverse, image_size, train)
+        path = os.path.join(cache_dir, key)
+
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            dataset = dataset_cls(root, imb_type=imb_type, imb_factor=imb_factor, rand_number=rand_number,
+                                  train=train, reverse=reverse, download=True)
+            data = np.asarray(dataset.data, dtype=np.uint8)
+            if image_size is not None and data.shape[1:3] != (image_size, image_size):
+                data = _resize(data, image_size)
+            targets = np.asarray(dataset.targets, dtype=np.int64)
+            cls_num_list = np.bincount(targets, minlength=dataset_cls.cls_num).tolist()
+
+            os.makedirs(path, exist_ok=True)
+            _save_atomic(os.path.join(path, 'data.npy'), np.ascontiguousarray(data))
+            _save_atomic(os.path.join(path, 'targets.npy'), targets)
+            ClassIndex.from_targets(targets).save(path)
+            # meta.json is written last, its presence marks a complete entry
+            tmp = os.path.join(path, 'meta.json.{}.tmp'.format(os.getpid()))
+            with open(tmp, 'w') as f:
+                json.dump({'key': key, 'cls_num_list': cls_num_list, 'classes': getattr(dataset, 'classes', None)}, f)
+            os.replace(tmp, os.path.join(path, 'meta.json'))
+
+        return cls(path, transform=transform, target_transform=target_transform)
+
+    def get_cls_num_list(self):
+        return list(self.meta['cls_num_list'])
+
+    def stats(self, per_class=False, num_workers=0):
+        # {'count', 'mean', 'std'} in ToTensor scale, plus 'classes' with per_class=True (datasets.stats)
+        return load_or_compute_stats(self.path, self.data, self.targets if per_class else None,
+                                     num_workers=num_workers)
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, index):
+        img, target = self.data[index], int(self.targets[index])
+        img = Image.fromarray(np.asarray(img))
+
+        if self.transform is not None:
+            img = self.transform(img)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+        return img, target
+
+
+if __name__ == '__main__':
+    import time
+    from datasets.imbalance_mnist import Imbalanced_MNIST
+
+    start = time.perf_counter()
+    dataset = CachedImageDataset.load_or_build(Imbalanced_MNIST, '~/data/', imb_factor=0.01, image_size=32)
+    print(dataset.path, len(dataset), dataset.data.shape, time.perf_counter() - start)
+    print(dataset.get_cls_num_list())
@@ -0,0 +1,72 @@
+import os
+import numpy as np
+
+
+class ClassIndex:
+    """
+    Class -> sample indices lookup in CSR form, built with one stable argsort of the targets.
+
+    indices holds every sample index grouped by class (ascending within a class), the samples of
+    classes[i] are indices[offsets[i]:offsets[i + 1]]. Only classes present in the targets are kept.
+    ClassIndex.of(dataset) builds it once and keeps it on the dataset as dataset.class_index,
+    CachedImageDataset stores it next to the cached data.
+    """
+
+    FILENAME = 'class_index.npz'
+
+    def __init__(self, classes, offsets, indices):
+        self.classes = np.asarray(classes, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+
+    @classmethod
+    def from_targets(cls, targets):
+        targets = np.asarray(targets, dtype=np.int64)
+        indices = np.argsort(targets, kind='stable')
+        classes, counts = np.unique(targets[indices], return_counts=True)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return cls(classes, offsets, indices)
+
+    @classmethod
+    def of(cls, dataset):
+        class_index = getattr(dataset, 'class_index', None)
+        if not isinstance(class_index, ClassIndex):
+            class_index = cls.from_targets(dataset.targets)
+            try:
+                dataset.class_index = class_index
+            except AttributeError:
+                pass
+        return class_index
+
+    @classmethod
+    def load(cls, path):
+        with np.load(os.path.join(path, cls.FILENAME)) as f:
+            return cls(f['classes'], f['offsets'], f['indices'])
+
+    def save(self, path):
+        tmp = os.path.join(path, self.FILENAME + '.{}.tmp.npz'.format(os.getpid()))
+        np.savez(tmp, classes=self.classes, offsets=self.offsets, indices=self.indices)
+        os.replace(tmp, os.path.join(path, self.FILENAME))
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.classes)
+
+    def __getitem__(self, label):
+        # view of the indices of one class, empty if the class is absent
+        i = np.searchsorted(self.classes, label)
+        if i == len(self.classes) or self.classes[i] != label:
+            return self.indices[:0]
+        return self.indices[self.offsets[i]:self.offsets[i + 1]]
+
+    def select(self, labels):
+        """Indices of all samples of the given label(s), grouped by label in the given order."""
+        if np.ndim(labels) == 0:
+            return self[labels]
+        return np.concatenate([self[label] for label in labels] or [self.indices[:0]])
+
+    def buckets(self):
+        return [self.indices[start:end] for start, end in zip(self.offsets[:-1], self.offsets[1:])]
@@ -0,0 +1,50 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+
+def open_image(source, size=None):
+    """
+    Image.open on a path or encoded bytes.
+    With size, JPEGs are decoded through PIL draft mode: the DCT is scaled down by 1/2, 1/4 or 1/8
+    to the smallest scale that still keeps both sides >= size, so a following Resize(size) has far
+    fewer pixels to decode and filter.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    img = Image.open(source)
+    if size is not None:
+        img.draft(img.mode, (size, size))
+    img.load()
+    return img
+
+
+class BatchDecoder:
+    """
+    Decodes (and transforms) a list of images on a thread pool.
+    PIL releases the GIL inside the JPEG decoder and most resampling filters, so threads scale with cores.
+    The pool is created lazily and dropped on pickling, so the decoder can live in a Dataset used by workers.
+    """
+
+    def __init__(self, num_threads=4, size=None):
+        self.num_threads = num_threads
+        self.size = size
+        self._pool = None
+
+    def _decode(self, source, transform):
+        img = open_image(source, self.size)
+        if transform is not None:
+            img = transform(img)
+        return img
+
+    def __call__(self, sources, transform=None):
+        if self.num_threads <= 1 or len(sources) <= 1:
+            return [self._decode(source, transform) for source in sources]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.num_threads)
+        return list(self._pool.map(self._decode, sources, [transform] * len(sources)))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
@@ -0,0 +1,49 @@
+import numpy as np
+
+
+def imbalanced_counts(img_max, cls_num, imb_type='exp', imb_factor=0.01, reverse=False):
+    """
+    Number of images kept per class.
+    imb_type is 'exp', 'step', anything else for a balanced subset, or a sequence of cls_num per class counts.
+    """
+    if not isinstance(imb_type, str):
+        counts = np.asarray(imb_type, dtype=np.int64)
+        assert counts.shape == (cls_num,), "expected {} per class counts, got shape {}".format(cls_num, counts.shape)
+        return counts.tolist()
+
+    if imb_type == 'exp':
+        exponent = np.arange(cls_num) / (cls_num - 1.0)
+        if reverse:
+            exponent = exponent[::-1]
+        return (img_max * imb_factor ** exponent).astype(np.int64).tolist()
+    elif imb_type == 'step':
+        half = cls_num // 2
+        return [int(img_max)] * half + [int(img_max * imb_factor)] * half
+    return [int(img_max)] * cls_num
+
+
+def imbalanced_indices(targets, img_num_per_cls, shuffle=True):
+    """
+    Indices of an imbalanced subset in O(N): targets are grouped by one stable argsort and the first
+    img_num_per_cls[i] samples of the i-th present class are taken with one mask.
+
+    With shuffle, every class is shuffled in place with np.random.shuffle in class order, so a given
+    np.random.seed selects the same samples as the former per class np.where loop.
+    Returns the indices (grouped by class) and the {class: requested count} dict.
+    """
+    targets = np.asarray(targets, dtype=np.int64)
+    order = np.argsort(targets, kind='stable')
+    classes, starts, counts = np.unique(targets[order], return_index=True, return_counts=True)
+
+    num_classes = min(len(classes), len(img_num_per_cls))
+    if shuffle:
+        for start, count in zip(starts[:num_classes], counts[:num_classes]):
+            np.random.shuffle(order[start:start + count])
+
+    limit = np.zeros(len(classes), dtype=np.int64)
+    limit[:num_classes] = img_num_per_cls[:num_classes]
+    rank = np.arange(len(order)) - np.repeat(starts, counts)
+    selected = order[rank < np.repeat(limit, counts)]
+
+    num_per_cls_dict = {int(c): int(n) for c, n in zip(classes[:num_classes], img_num_per_cls[:num_classes])}
+    return selected, num_per_cls_dict
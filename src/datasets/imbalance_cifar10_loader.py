@@ -3,45 +3,16 @@ import torch
 import random
 import numpy as np
 import os, sys
+from functools import partial
 from torchvision import datasets, transforms
 from torch.utils.data import DataLoader, Dataset, Sampler
 from PIL import Image
 from datasets.imbalance_cifar import Imbalanced_CIFAR10, Imbalanced_CIFAR100
-
-
-class BalancedSampler(Sampler):
-    def __init__(self, buckets, retain_epoch_size=False):
-        for bucket in buckets:
-            random.shuffle(bucket)
-
-        self.bucket_num = len(buckets)
-        self.buckets = buckets
-        self.bucket_pointers = [0 for _ in range(self.bucket_num)]
-        self.retain_epoch_size = retain_epoch_size
-
-    def __iter__(self):
-        count = self.__len__()
-        print('sampler', count)
-        while count > 0:
-            yield self._next_item()
-            count -= 1
-
-    def _next_item(self):
-        bucket_idx = random.randint(0, self.bucket_num - 1)
-        bucket = self.buckets[bucket_idx]
-        item = bucket[self.bucket_pointers[bucket_idx]]
-        self.bucket_pointers[bucket_idx] += 1
-        if self.bucket_pointers[bucket_idx] == len(bucket):
-            self.bucket_pointers[bucket_idx] = 0
-            random.shuffle(bucket)
-        return item
-
-    def __len__(self):
-        if self.retain_epoch_size:
-            return sum([len(bucket) for bucket in self.buckets])  # AcruQRally we need to upscale to next full batch
-        else:
-            return max([len(bucket) for bucket in
-                        self.buckets]) * self.bucket_num  # Ensures every instance has the chance to be visited in an epoch
+from datasets.integrity import VerifiedCIFAR10
+from datasets.sampler import BalancedSampler, StratifiedBatchSampler, PrioritySampler, WithIndices
+from datasets.synthetic import Synthetic_CIFAR10
+from datasets.tensor_dataset import InMemoryImageDataset, batch_collate
+from datasets.batch_transforms import BatchCompose, BatchRandomCrop, BatchRandomHorizontalFlip, BatchRandomRotation
 
 
 class ImbalanceCIFAR10DataLoader(DataLoader):
@@ -50,27 +21,43 @@ class ImbalanceCIFAR10DataLoader(DataLoader):
     """
 
     def __init__(self, data_dir, batch_size, shuffle=True, num_workers=1, training=True, balanced=False,
-                 retain_epoch_size=True, imb_factor=0.01):
+                 retain_epoch_size=True, imb_factor=0.01, samples_per_class=None, priority=None,
+                 batch_augmentation=False, uint8=False, synthetic=False, collate_fn=None):
+        if samples_per_class is not None and training:
+            # the stratified batch sampler fixes the batch composition and shuffles on its own
+            if balanced or priority is not None:
+                raise ValueError("samples_per_class can not be combined with balanced or priority")
+            if not shuffle:
+                raise ValueError("samples_per_class batches are always shuffled, shuffle=False is not supported")
+
         normalize = transforms.Normalize(mean=[0.4914, 0.4822, 0.4465],
                                          std=[0.2023, 0.1994, 0.2010])
+        # uint8=True ships uint8 (N, C, H, W) batches instead of float32 ones, to be normalized on device
+        # by a model built with normalize=(loader.mean, loader.std) (models.normalize.InputNormalize)
+        self.mean, self.std = normalize.mean, normalize.std
+        to_tensor = [transforms.PILToTensor()] if uint8 else [transforms.ToTensor(), normalize]
         train_trsfm = transforms.Compose([
             transforms.RandomCrop(32, padding=4),
             transforms.RandomHorizontalFlip(),
             transforms.RandomRotation(15),
-            transforms.ToTensor(),
-            normalize,
+            *to_tensor,
         ])
         print(train_trsfm)
         test_trsfm = transforms.Compose([
-            transforms.ToTensor(),
-            normalize,
+            *to_tensor,
         ])
 
+        if synthetic:
+            # deterministic fake images behind the same interface, runs without the data files (datasets.synthetic)
+            train_cls, test_cls = Synthetic_CIFAR10, partial(Synthetic_CIFAR10, imb_factor=1)
+        else:
+            train_cls, test_cls = Imbalanced_CIFAR10, VerifiedCIFAR10
+
         if training:
-            dataset = Imbalanced_CIFAR10(data_dir, train=True, download=True, transform=train_trsfm, imb_factor=imb_factor)
-            val_dataset = datasets.CIFAR10(data_dir, train=False, download=True, transform=test_trsfm)  # test set
+            dataset = train_cls(data_dir, train=True, download=True, transform=train_trsfm, imb_factor=imb_factor)
+            val_dataset = test_cls(data_dir, train=False, download=True, transform=test_trsfm)  # test set
         else:
-            dataset = datasets.CIFAR10(data_dir, train=False, download=True, transform=test_trsfm)  # test set
+            dataset = test_cls(data_dir, train=False, download=True, transform=test_trsfm)  # test set
             val_dataset = None
 
         self.dataset = dataset
@@ -85,17 +72,44 @@ class ImbalanceCIFAR10DataLoader(DataLoader):
 
         self.cls_num_list = cls_num_list
 
+        if samples_per_class is not None and training:
+            # batch_size=None takes the implied size, anything else has to match it
+            if batch_size is not None and batch_size != samples_per_class * num_classes:
+                raise ValueError("batch_size {} does not match samples_per_class * num_classes = {}, pass "
+                                 "batch_size=None".format(batch_size, samples_per_class * num_classes))
+            batch_size = samples_per_class * num_classes
+
+        if batch_augmentation:
+            # the same augmentation on whole uint8 batches in the main process instead of per image in workers
+            train_batch_trsfm = BatchCompose([
+                BatchRandomCrop(32, padding=4),
+                BatchRandomHorizontalFlip(),
+                BatchRandomRotation(15),
+            ])
+            mean, std = (None, None) if uint8 else (normalize.mean, normalize.std)
+            self.dataset = InMemoryImageDataset(dataset, mean=mean, std=std,
+                                                transform=train_batch_trsfm if training else None)
+            if val_dataset is not None:
+                self.val_dataset = InMemoryImageDataset(val_dataset, mean=mean, std=std)
+            dataset = self.dataset
+
+        if balanced and priority is not None:
+            raise ValueError("balanced and priority both choose the sampler, pass only one of them")
+
+        sampler = None
         if balanced:
             if training:
-                buckets = [[] for _ in range(num_classes)]
-                for idx, label in enumerate(dataset.train_labels):
-                    buckets[label].append(idx)
-                sampler = BalancedSampler(buckets, retain_epoch_size)
+                sampler = BalancedSampler(dataset, retain_epoch_size)
                 shuffle = False
             else:
                 print("Test set will not be evaluated with balanced sampler, nothing is done to make it balanced")
-        else:
-            sampler = None
+
+        if priority is not None and training:
+            # 'sample' or 'class', batches are (images, labels, indices), feed the per-sample losses of every
+            # batch back through self.sampler.update(losses, indices)
+            sampler = PrioritySampler(dataset, per_class=priority == 'class')
+            shuffle = False
+            self.dataset = WithIndices(self.dataset)
 
         self.shuffle = shuffle
         self.init_kwargs = {
@@ -103,6 +117,18 @@ class ImbalanceCIFAR10DataLoader(DataLoader):
             'shuffle': self.shuffle,
             'num_workers': num_workers
         }
+        if batch_augmentation:
+            self.init_kwargs['collate_fn'] = batch_collate
+        elif collate_fn is not None:
+            # e.g. datasets.prefetch.list_collate, DevicePrefetcher then collates into its staging buffers
+            self.init_kwargs['collate_fn'] = collate_fn
+
+        if samples_per_class is not None and training:
+            # fixed per-class quota in every batch of samples_per_class * num_classes (checked above)
+            batch_sampler = StratifiedBatchSampler(dataset, samples_per_class, retain_epoch_size)
+            super().__init__(dataset=self.dataset, batch_sampler=batch_sampler, num_workers=num_workers,
+                             collate_fn=self.init_kwargs.get('collate_fn'))
+            return
 
         super().__init__(dataset=self.dataset, **self.init_kwargs,
                          sampler=sampler)  # Note that sampler does not apply to validation set
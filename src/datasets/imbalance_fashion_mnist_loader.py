@@ -7,41 +7,8 @@ from torchvision import datasets, transforms
 from torch.utils.data import DataLoader, Dataset, Sampler
 from PIL import Image
 from datasets.imbalance_fashion_mnist import Imbalanced_FashionMNIST
-
-
-class BalancedSampler(Sampler):
-    def __init__(self, buckets, retain_epoch_size=False):
-        for bucket in buckets:
-            random.shuffle(bucket)
-
-        self.bucket_num = len(buckets)
-        self.buckets = buckets
-        self.bucket_pointers = [0 for _ in range(self.bucket_num)]
-        self.retain_epoch_size = retain_epoch_size
-
-    def __iter__(self):
-        count = self.__len__()
-        print('sampler', count)
-        while count > 0:
-            yield self._next_item()
-            count -= 1
-
-    def _next_item(self):
-        bucket_idx = random.randint(0, self.bucket_num - 1)
-        bucket = self.buckets[bucket_idx]
-        item = bucket[self.bucket_pointers[bucket_idx]]
-        self.bucket_pointers[bucket_idx] += 1
-        if self.bucket_pointers[bucket_idx] == len(bucket):
-            self.bucket_pointers[bucket_idx] = 0
-            random.shuffle(bucket)
-        return item
-
-    def __len__(self):
-        if self.retain_epoch_size:
-            return sum([len(bucket) for bucket in self.buckets])  # AcruQRally we need to upscale to next full batch
-        else:
-            return max([len(bucket) for bucket in
-                        self.buckets]) * self.bucket_num  # Ensures every instance has the chance to be visited in an epoch
+from datasets.sampler import BalancedSampler
+from datasets.tensor_dataset import InMemoryImageDataset, batch_collate
 
 
 class ImbalanceFASHIONMNISTDataLoader(DataLoader):
@@ -50,7 +17,7 @@ class ImbalanceFASHIONMNISTDataLoader(DataLoader):
     """
 
     def __init__(self, data_dir, batch_size, shuffle=True, num_workers=1, training=True, balanced=False,
-                 retain_epoch_size=True, imb_factor=0.01):
+                 retain_epoch_size=True, imb_factor=0.01, in_memory=False):
         normalize = transforms.Normalize(mean=[0.5],
                                          std=[0.5])
         train_trsfm = transforms.Compose([
@@ -86,12 +53,17 @@ class ImbalanceFASHIONMNISTDataLoader(DataLoader):
 
         self.cls_num_list = cls_num_list
 
+        if in_memory:
+            # no random augmentation here, so batches can be gathered from one uint8 tensor
+            self.dataset = InMemoryImageDataset(dataset, mean=normalize.mean, std=normalize.std,
+                                                image_size=32 if training else None)
+            if val_dataset is not None:
+                self.val_dataset = InMemoryImageDataset(val_dataset, mean=normalize.mean, std=normalize.std)
+            dataset = self.dataset
+
         if balanced:
             if training:
-                buckets = [[] for _ in range(num_classes)]
-                for idx, label in enumerate(dataset.targets):
-                    buckets[label].append(idx)
-                sampler = BalancedSampler(buckets, retain_epoch_size)
+                sampler = BalancedSampler(dataset, retain_epoch_size)
                 shuffle = False
             else:
                 print("Test set will not be evaluated with balanced sampler, nothing is done to make it balanced")
@@ -104,6 +76,8 @@ class ImbalanceFASHIONMNISTDataLoader(DataLoader):
             'shuffle': self.shuffle,
             'num_workers': num_workers
         }
+        if in_memory:
+            self.init_kwargs['collate_fn'] = batch_collate
 
         super().__init__(dataset=self.dataset, **self.init_kwargs,
                          sampler=sampler)  # Note that sampler does not apply to validation set
@@ -4,11 +4,13 @@ from torchvision.datasets import MNIST
 from torch.utils.data import Sampler, DataLoader
 from torchvision.transforms import Compose, ToTensor, Normalize, Resize
 import numpy as np
+from datasets.imbalance import imbalanced_counts, imbalanced_indices
+from datasets.shared import SharedMemoryMixin
 import random
 from datasets.sampler import BalancedSampler
 
 
-class Imbalanced_MNIST(MNIST):
+class Imbalanced_MNIST(SharedMemoryMixin, MNIST):
     cls_num = 10
 
     def __init__(self, root, imb_type='exp', train=True,imb_factor=0.01, rand_number=0,
@@ -19,49 +21,17 @@ class Imbalanced_MNIST(MNIST):
         img_num_list = self.get_img_num_per_cls(self.cls_num, imb_type, imb_factor, reverse)
         self.gen_imbalanced_data(img_num_list)
         self.reverse = reverse
+        self.share_memory_()
 
     def get_img_num_per_cls(self, cls_num, imb_type, imb_factor, reverse):
         img_max = len(self.data) / cls_num
-        img_num_per_cls = []
-
-        if imb_type == 'exp':
-            for cls_idx in range(cls_num):
-                if reverse:
-                    num = img_max * (imb_factor ** (((cls_num - 1) - cls_idx) / (cls_num - 1.0)))
-                    img_num_per_cls.append(int(num))
-                else:
-                    num = img_max * (imb_factor ** (cls_idx / (cls_num - 1.0)))
-                    img_num_per_cls.append(int(num))
-        elif imb_type == 'step':
-            for cls_idx in range(cls_num // 2):
-                img_num_per_cls.append(int(img_max))
-            for cls_idx in range(cls_num // 2):
-                img_num_per_cls.append(int(img_max * imb_factor))
-        else:
-            img_num_per_cls.extend([int(img_max)] * cls_num)
-        return img_num_per_cls
+        return imbalanced_counts(img_max, cls_num, imb_type, imb_factor, reverse)
 
     def gen_imbalanced_data(self, img_num_per_cls):
-        new_data = []
-        new_targets = []
-
-        targets_np = np.array(self.targets, dtype=np.int64)
-
-        classes = np.unique(targets_np)
-        # np.random.shuffle(classes)
-        self.num_per_cls_dict = dict()
-        for the_class, the_img_num in zip(classes, img_num_per_cls):
-            self.num_per_cls_dict[the_class] = the_img_num
-            idx = np.where(targets_np == the_class)[0]
-            # np.random.shuffle(idx)
-            selec_idx = idx[:the_img_num]
-            new_data.append(self.data[selec_idx, ...])
-            # new_targets.extend([the_class, ] * the_img_num)
-            new_targets.extend(targets_np[selec_idx])
-
-        new_data = np.vstack(new_data)
-        self.data = torch.tensor(new_data)
-        self.targets = torch.tensor(new_targets)
+        selec_idx, self.num_per_cls_dict = imbalanced_indices(self.targets, img_num_per_cls, shuffle=False)
+        selec_idx = torch.from_numpy(selec_idx)
+        self.data = self.data[selec_idx, ...]
+        self.targets = torch.as_tensor(self.targets)[selec_idx]
 
     def get_cls_num_list(self):
         cls_num_list = []
@@ -3,45 +3,13 @@ import torch
 import random
 import numpy as np
 import os, sys
+from functools import partial
 from torchvision import datasets, transforms
 from torch.utils.data import DataLoader, Dataset, Sampler
 from PIL import Image
 from datasets.imbalance_mnist import Imbalanced_MNIST
-
-
-class BalancedSampler(Sampler):
-    def __init__(self, buckets, retain_epoch_size=False):
-        for bucket in buckets:
-            random.shuffle(bucket)
-
-        self.bucket_num = len(buckets)
-        self.buckets = buckets
-        self.bucket_pointers = [0 for _ in range(self.bucket_num)]
-        self.retain_epoch_size = retain_epoch_size
-
-    def __iter__(self):
-        count = self.__len__()
-        print('sampler', count)
-        while count > 0:
-            yield self._next_item()
-            count -= 1
-
-    def _next_item(self):
-        bucket_idx = random.randint(0, self.bucket_num - 1)
-        bucket = self.buckets[bucket_idx]
-        item = bucket[self.bucket_pointers[bucket_idx]]
-        self.bucket_pointers[bucket_idx] += 1
-        if self.bucket_pointers[bucket_idx] == len(bucket):
-            self.bucket_pointers[bucket_idx] = 0
-            random.shuffle(bucket)
-        return item
-
-    def __len__(self):
-        if self.retain_epoch_size:
-            return sum([len(bucket) for bucket in self.buckets])  # AcruQRally we need to upscale to next full batch
-        else:
-            return max([len(bucket) for bucket in
-                        self.buckets]) * self.bucket_num  # Ensures every instance has the chance to be visited in an epoch
+from datasets.sampler import BalancedSampler
+from datasets.synthetic import Synthetic_MNIST
 
 
 class ImbalanceMNISTDataLoader(DataLoader):
@@ -50,7 +18,7 @@ class ImbalanceMNISTDataLoader(DataLoader):
     """
 
     def __init__(self, data_dir, batch_size, shuffle=True, num_workers=1, training=True, balanced=False,
-                 retain_epoch_size=True, imb_factor=0.01):
+                 retain_epoch_size=True, imb_factor=0.01, synthetic=False):
         normalize = transforms.Normalize(mean=[0.5],
                                          std=[0.5])
         train_trsfm = transforms.Compose([
@@ -67,11 +35,17 @@ class ImbalanceMNISTDataLoader(DataLoader):
             normalize,
         ])
 
+        if synthetic:
+            # deterministic fake images behind the same interface, runs without the data files (datasets.synthetic)
+            train_cls, test_cls = Synthetic_MNIST, partial(Synthetic_MNIST, imb_factor=1)
+        else:
+            train_cls, test_cls = Imbalanced_MNIST, datasets.MNIST
+
         if training:
-            dataset = Imbalanced_MNIST(data_dir, download=True, transform=train_trsfm, imb_factor=imb_factor)
-            val_dataset = datasets.MNIST(data_dir, train=False, download=True, transform=test_trsfm)  # test set
+            dataset = train_cls(data_dir, download=True, transform=train_trsfm, imb_factor=imb_factor)
+            val_dataset = test_cls(data_dir, train=False, download=True, transform=test_trsfm)  # test set
         else:
-            dataset = datasets.MNIST(data_dir, train=False, download=True, transform=test_trsfm)  # test set
+            dataset = test_cls(data_dir, train=False, download=True, transform=test_trsfm)  # test set
             val_dataset = None
 
         self.dataset = dataset
@@ -88,10 +62,7 @@ class ImbalanceMNISTDataLoader(DataLoader):
 
         if balanced:
             if training:
-                buckets = [[] for _ in range(num_classes)]
-                for idx, label in enumerate(dataset.train_labels):
-                    buckets[label].append(idx)
-                sampler = BalancedSampler(buckets, retain_epoch_size)
+                sampler = BalancedSampler(dataset, retain_epoch_size)
                 shuffle = False
             else:
                 print("Test set will not be evaluated with balanced sampler, nothing is done to make it balanced")
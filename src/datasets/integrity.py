@@ -0,0 +1,81 @@
+import os
+import json
+import pickle
+import torchvision
+from torchvision.datasets.utils import check_integrity
+
+MARKER = '.verified.json'
+
+
+def _load_marker(directory):
+    try:
+        with open(os.path.join(directory, MARKER)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _stat(fpath):
+    st = os.stat(fpath)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def check_integrity_once(fpath, md5=None):
+    """
+    torchvision's check_integrity, but a successful md5 check is recorded in a marker file next to fpath
+    together with the file size and mtime, and is not recomputed while those stay unchanged.
+    """
+    if not os.path.isfile(fpath):
+        return False
+    if md5 is None:
+        return True
+
+    directory, name = os.path.split(fpath)
+    marker = _load_marker(directory)
+    entry = marker.get(name)
+    if entry is not None and entry['md5'] == md5 and entry['stat'] == _stat(fpath):
+        return True
+
+    if not check_integrity(fpath, md5):
+        return False
+
+    marker = _load_marker(directory)
+    marker[name] = {'md5': md5, 'stat': _stat(fpath)}
+    try:
+        tmp = os.path.join(directory, MARKER + '.{}.tmp'.format(os.getpid()))
+        with open(tmp, 'w') as f:
+            json.dump(marker, f)
+        os.replace(tmp, os.path.join(directory, MARKER))
+    except OSError:
+        # read-only dataset directory, keep hashing every time
+        pass
+    return True
+
+
+class VerifiedOnceMixin:
+    """Replaces the full md5 pass of CIFAR10 / CIFAR100 (run twice per construction with download=True)."""
+
+    def _check_integrity(self):
+        for filename, md5 in self.train_list + self.test_list:
+            fpath = os.path.join(self.root, self.base_folder, filename)
+            if not check_integrity_once(fpath, md5):
+                return False
+        return True
+
+    def _load_meta(self):
+        path = os.path.join(self.root, self.base_folder, self.meta['filename'])
+        if not check_integrity_once(path, self.meta['md5']):
+            raise RuntimeError("Dataset metadata file not found or corrupted. You can use download=True to download it")
+        # torchvision's body without its second check_integrity
+        with open(path, 'rb') as infile:
+            data = pickle.load(infile, encoding='latin1')
+            self.classes = data[self.meta['key']]
+        self.class_to_idx = {_class: i for i, _class in enumerate(self.classes)}
+
+
+class VerifiedCIFAR10(VerifiedOnceMixin, torchvision.datasets.CIFAR10):
+    pass
+
+
+class VerifiedCIFAR100(VerifiedOnceMixin, torchvision.datasets.CIFAR100):
+    pass
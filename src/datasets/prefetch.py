@@ -0,0 +1,146 @@
+import queue
+import threading
+import torch
+
+
+class SampleList(list):
+    """Uncollated batch (list of samples) returned by list_collate."""
+
+
+def list_collate(batch):
+    # leaves the list of samples to DevicePrefetcher, which collates it straight into its staging buffers
+    return SampleList(batch)
+
+
+def _fields(batch):
+    # list of samples -> list of per-field value lists, collated batch -> its list of fields
+    if isinstance(batch, SampleList):
+        return [list(field) for field in zip(*batch)], len(batch)
+    return list(batch), len(batch[0])
+
+
+class DevicePrefetcher:
+    """
+    Iterates a DataLoader on a background thread and keeps num_prefetch batches ready on device.
+
+    Every batch is collated (or copied, if the loader already collated it) into a ring of preallocated
+    staging buffers, pinned when the device is CUDA, and sent with non_blocking copies on a side stream,
+    so host to device transfers overlap with compute. With collate_fn=list_collate the loader skips
+    default_collate and the samples are stacked directly into the staging buffers.
+    On CPU there is no transfer: batches already collated by the loader are passed through as they are,
+    lists of samples are stacked into the staging buffers, which are the batches, and a CPU batch may
+    then be overwritten once the following batch has been requested (clone it to keep it).
+    Fields that are not tensors (e.g. lists of file names) are passed through.
+    """
+
+    def __init__(self, loader, device='cpu', num_prefetch=2):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.num_prefetch = num_prefetch
+        self.cuda = self.device.type == 'cuda'
+        # queued + one being filled + one held by the consumer
+        self.num_slots = num_prefetch + 2
+        self.staging = [None] * self.num_slots
+        self.events = [None] * self.num_slots
+
+    def __len__(self):
+        return len(self.loader)
+
+    def _buffers(self, slot, fields, n):
+        buffers = self.staging[slot]
+        if buffers is None or any(b is not None and b.size(0) < n for b in buffers):
+            buffers = []
+            for field in fields:
+                if not self._is_tensor_field(field):
+                    buffers.append(None)
+                    continue
+                sample = torch.as_tensor(field[0])
+                buffers.append(torch.empty((n,) + tuple(sample.shape), dtype=sample.dtype,
+                                           pin_memory=self.cuda))
+            self.staging[slot] = buffers
+        return [b if b is None else b[:n] for b in buffers]
+
+    @staticmethod
+    def _is_tensor_field(field):
+        # strings (file names, ...) are not staged
+        return torch.is_tensor(field) or not isinstance(field[0], (str, bytes))
+
+    def _stage(self, slot, batch):
+        if not isinstance(batch, SampleList) and not self.cuda:
+            # fresh tensors from the loader's collate, a copy would not hide any transfer
+            return list(batch)
+        fields, n = _fields(batch)
+        if self.events[slot] is not None:
+            # the previous transfer out of this slot has to finish before it is overwritten
+            self.events[slot].synchronize()
+        buffers = self._buffers(slot, fields, n)
+        staged = []
+        for buffer, field in zip(buffers, fields):
+            if buffer is None:
+                staged.append(field)
+            elif isinstance(field, list):
+                if torch.is_tensor(field[0]):
+                    torch.stack(field, out=buffer)
+                else:
+                    buffer.copy_(torch.as_tensor(field))
+                staged.append(buffer)
+            else:
+                buffer.copy_(field)
+                staged.append(buffer)
+        return staged
+
+    @staticmethod
+    def _put(out, stop, item):
+        # gives up once the consumer has stopped iterating
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, out, stop):
+        stream = torch.cuda.Stream(self.device) if self.cuda else None
+        try:
+            for i, batch in enumerate(self.loader):
+                slot = i % self.num_slots
+                buffers = self._stage(slot, batch)
+                event = None
+                if self.cuda:
+                    with torch.cuda.stream(stream):
+                        buffers = [b.to(self.device, non_blocking=True) if torch.is_tensor(b) else b
+                                   for b in buffers]
+                        event = torch.cuda.Event()
+                        event.record(stream)
+                    self.events[slot] = event
+                if not self._put(out, stop, (buffers, event)):
+                    return
+            self._put(out, stop, StopIteration)
+        except Exception as e:
+            self._put(out, stop, e)
+
+    def __iter__(self):
+        out = queue.Queue(maxsize=self.num_prefetch)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._produce, args=(out, stop), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = out.get()
+                if item is StopIteration:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                buffers, event = item
+                if event is not None:
+                    stream = torch.cuda.current_stream(self.device)
+                    stream.wait_event(event)
+                    for b in buffers:
+                        # allocated on the side stream, used on this one
+                        if torch.is_tensor(b):
+                            b.record_stream(stream)
+                yield buffers
+        finally:
+            stop.set()
+            thread.join()
@@ -0,0 +1,78 @@
+from torch.utils.data import DataLoader
+
+
+class ResumableDataLoader(DataLoader):
+    """
+    DataLoader that counts the batches handed out in the current epoch and can be checkpointed.
+
+    state_dict() holds that count and the sampler state of the epoch in progress. After load_state_dict
+    the next iteration regenerates the interrupted epoch from the sampler's (seed, epoch) and starts
+    right after the last consumed batch, without loading the skipped items.
+    Needs a sampler or batch_sampler with state_dict / load_state_dict (datasets.sampler);
+    with anything else (e.g. shuffle=True) only the batch count is kept.
+
+    By default a batch counts as consumed when it is yielded. Consumers that fetch ahead of the batch they
+    train (Lightning's data fetcher) pass count_on_yield=False and call consume() when a batch is actually
+    trained on, e.g. from on_train_batch_start, so a checkpoint never skips the batches fetched in advance.
+    """
+
+    def __init__(self, *args, count_on_yield=True, **kwargs):
+        super(ResumableDataLoader, self).__init__(*args, **kwargs)
+        self.count_on_yield = count_on_yield
+        self.batches = 0
+        self._yielded = 0
+        self._iterating = False
+        self._start_state = None
+
+    def _stateful_sampler(self):
+        # (sampler, items per batch) of the object whose state gets saved
+        if hasattr(self.batch_sampler, 'state_dict'):
+            return self.batch_sampler, 1
+        if hasattr(self.sampler, 'state_dict'):
+            return self.sampler, self.batch_size
+        return None, None
+
+    def __iter__(self):
+        sampler, _ = self._stateful_sampler()
+        # taken before the sampler starts the epoch: this is the state that reproduces it
+        self._start_state = sampler.state_dict() if sampler is not None else None
+        # batches consumed before a resume were never yielded in this run
+        self._yielded = self.batches
+        self._iterating = True
+        for batch in super(ResumableDataLoader, self).__iter__():
+            self._yielded += 1
+            if self.count_on_yield:
+                self.batches += 1
+            yield batch
+        self.batches = 0
+        self._yielded = 0
+        self._iterating = False
+        self._start_state = None
+
+    def consume(self, n=1):
+        # with count_on_yield=False: n more of the yielded batches have been trained on
+        if self._iterating:
+            self.batches = min(self.batches + n, self._yielded)
+
+    def state_dict(self):
+        sampler, _ = self._stateful_sampler()
+        state = {'batches': self.batches}
+        if sampler is not None:
+            sampler_state = sampler.state_dict()
+            if self._start_state is not None:
+                # epoch in progress, keep anything else (e.g. priorities) current
+                sampler_state.update({key: self._start_state[key] for key in ('seed', 'epoch')
+                                      if key in self._start_state})
+            state['sampler'] = sampler_state
+        return state
+
+    def load_state_dict(self, state):
+        self.batches = state['batches']
+        self._iterating = False
+        self._start_state = None
+        sampler, per_batch = self._stateful_sampler()
+        if sampler is not None and 'sampler' in state:
+            sampler_state = dict(state['sampler'])
+            # batches counts the whole epoch, including batches consumed before an earlier resume
+            sampler_state['offset'] = self.batches * per_batch
+            sampler.load_state_dict(sampler_state)
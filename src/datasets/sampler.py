@@ -2,63 +2,123 @@ import torch
 import random
 import numpy as np
 from torch.utils.data import Sampler, Dataset
+from datasets.class_index import ClassIndex
 
 class SelectSampler(Sampler):
-    def __init__(self, dataset, target_label, shuffle):
-        targets = torch.tensor(dataset.train_labels)
-        self.target_idx = np.where(targets == target_label)[0]
+    """
+    Yields only the samples of target_label, a single label or a list of labels.
+    The lookup goes through the dataset's ClassIndex, a shared one can be passed as class_index.
+    """
+
+    def __init__(self, dataset, target_label, shuffle, class_index=None):
+        class_index = ClassIndex.of(dataset) if class_index is None else class_index
+        self.target_idx = class_index.select(target_label)
         self.shuffle = shuffle
         self.n = len(self.target_idx)
+        # seed of the next shuffled pass, drawn ahead so that state_dict can record it
+        self.seed = self._new_seed()
+        self.offset = 0
+
+    @staticmethod
+    def _new_seed():
+        return int(torch.empty((), dtype=torch.int64).random_().item())
+
+    def state_dict(self):
+        return {'seed': self.seed, 'offset': self.offset}
+
+    def load_state_dict(self, state):
+        self.seed = state['seed']
+        self.offset = state.get('offset', 0)
 
     def __iter__(self):
+        offset, self.offset = self.offset, 0
         if self.shuffle:
             generator = torch.Generator()
-            generator.manual_seed(int(torch.empty((), dtype=torch.int64).random_().item()))
-            yield from self.target_idx[torch.randperm(self.n, generator=generator).tolist()]
+            generator.manual_seed(self.seed)
+            self.seed = self._new_seed()
+            yield from self.target_idx[torch.randperm(self.n, generator=generator).numpy()[offset:]].tolist()
         else:
-            yield from self.target_idx
+            yield from self.target_idx[offset:].tolist()
 
     def __len__(self):
         return self.n
 
-class BalancedSampler(Sampler):
-    def __init__(self, dataset, retain_epoch_size=False):
+class EpochSampler(Sampler):
+    """
+    Base of the samplers whose epoch is a function of (seed, epoch).
+
+    state_dict / load_state_dict carry seed, epoch and offset, the number of items the next __iter__
+    skips: a restored sampler regenerates the interrupted epoch and continues right after the items
+    already consumed (datasets.resumable.ResumableDataLoader fills in offset).
+    """
+
+    def __init__(self, seed=None):
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.epoch = 0
+        self.offset = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def state_dict(self):
+        return {'seed': self.seed, 'epoch': self.epoch, 'offset': self.offset}
 
-        targets = dataset.targets
+    def load_state_dict(self, state):
+        self.seed = state['seed']
+        self.epoch = state['epoch']
+        self.offset = state.get('offset', 0)
 
-        num_classes = len(np.unique(targets))
-        cls_num_list = [0] * num_classes
-        for label in targets:
-            cls_num_list[label] += 1
+    def _next_epoch(self):
+        # (epoch, offset) of the pass __iter__ is starting
+        epoch, offset = self.epoch, self.offset
+        self.epoch += 1
+        self.offset = 0
+        return epoch, offset
 
-        buckets = [[] for _ in range(num_classes)]
-        for idx, label in enumerate(targets):
-            buckets[label].append(idx)
 
-        for bucket in buckets:
-            random.shuffle(bucket)
+def _draw_cycles(rng, bucket, n):
+    # n items of bucket taken from as many fresh permutations of it as needed
+    cycles = -(-n // len(bucket))
+    perm = rng.random((cycles, len(bucket))).argsort(axis=1)
+    return bucket[perm].ravel()[:n]
 
-        self.bucket_num = len(buckets)
-        self.buckets = buckets
-        self.bucket_pointers = [0 for _ in range(self.bucket_num)]
+
+class BalancedSampler(EpochSampler):
+    """
+    Picks a class uniformly at random for every position of the epoch and takes the next
+    item of that class, every class is walked through in reshuffled, non-repeating cycles.
+
+    The whole epoch is built at once with NumPy, from a generator seeded by (seed, epoch).
+    The epoch advances on every __iter__ unless set_epoch is called.
+    """
+
+    def __init__(self, dataset, retain_epoch_size=False, seed=None, class_index=None):
+        super(BalancedSampler, self).__init__(seed)
+        class_index = ClassIndex.of(dataset) if class_index is None else class_index
+        self.buckets = class_index.buckets()
+        self.bucket_num = len(self.buckets)
         self.retain_epoch_size = retain_epoch_size
 
+    def _epoch_indices(self, epoch):
+        rng = np.random.default_rng([self.seed, epoch])
+        count = len(self)
+
+        bucket_idx = rng.integers(0, self.bucket_num, size=count)
+        per_bucket = np.bincount(bucket_idx, minlength=self.bucket_num)
+        positions = np.argsort(bucket_idx, kind='stable')
+
+        indices = np.empty(count, dtype=np.int64)
+        start = 0
+        for bucket, n in zip(self.buckets, per_bucket):
+            if n == 0:
+                continue
+            indices[positions[start:start + n]] = _draw_cycles(rng, bucket, n)
+            start += n
+        return indices
+
     def __iter__(self):
-        count = self.__len__()
-        # print('sampler', count)
-        while count > 0:
-            yield self._next_item()
-            count -= 1
-
-    def _next_item(self):
-        bucket_idx = random.randint(0, self.bucket_num - 1)
-        bucket = self.buckets[bucket_idx]
-        item = bucket[self.bucket_pointers[bucket_idx]]
-        self.bucket_pointers[bucket_idx] += 1
-        if self.bucket_pointers[bucket_idx] == len(bucket):
-            self.bucket_pointers[bucket_idx] = 0
-            random.shuffle(bucket)
-        return item
+        epoch, offset = self._next_epoch()
+        yield from self._epoch_indices(epoch)[offset:].tolist()
 
     def __len__(self):
         if self.retain_epoch_size:
@@ -68,6 +128,211 @@ class BalancedSampler(Sampler):
                         self.buckets]) * self.bucket_num  # Ensures every instance has the chance to be visited in an epoch
 
 
+class StratifiedBatchSampler(EpochSampler):
+    """
+    batch_sampler whose every batch holds samples_per_class items of each class
+    (batch size = samples_per_class * num_classes), in class order.
+
+    Like BalancedSampler every class is walked through in reshuffled, non-repeating cycles,
+    retain_epoch_size=True gives len(dataset) // batch_size batches per epoch, otherwise
+    enough batches for the largest class to be seen once.
+    """
+
+    def __init__(self, dataset, samples_per_class, retain_epoch_size=False, seed=None, class_index=None):
+        super(StratifiedBatchSampler, self).__init__(seed)
+        class_index = ClassIndex.of(dataset) if class_index is None else class_index
+        self.buckets = class_index.buckets()
+        self.bucket_num = len(self.buckets)
+        self.samples_per_class = samples_per_class
+        self.batch_size = samples_per_class * self.bucket_num
+        self.retain_epoch_size = retain_epoch_size
+
+    def _epoch_batches(self, epoch):
+        rng = np.random.default_rng([self.seed, epoch])
+        n = len(self) * self.samples_per_class
+        # (num_batches, num_classes * samples_per_class), one column block per class
+        return np.concatenate([_draw_cycles(rng, bucket, n).reshape(len(self), self.samples_per_class)
+                               for bucket in self.buckets], axis=1)
+
+    def __iter__(self):
+        # offset counts batches here
+        epoch, offset = self._next_epoch()
+        yield from self._epoch_batches(epoch)[offset:].tolist()
+
+    def __len__(self):
+        if self.retain_epoch_size:
+            return max(1, sum([len(bucket) for bucket in self.buckets]) // self.batch_size)
+        else:
+            return -(-max([len(bucket) for bucket in self.buckets]) // self.samples_per_class)
+
+
+class WithIndices(Dataset):
+    """
+    dataset whose samples also return their index, (image, target) -> (image, target, index), so that
+    per-sample losses can be sent back to an index based sampler (PrioritySampler.update(losses, indices)).
+    __getitems__ of the wrapped dataset is kept: a list of samples gets the index appended to every sample,
+    a collated tuple (InMemoryImageDataset) gets an int64 tensor of the indices appended.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __getattr__(self, name):
+        # targets, classes, get_cls_num_list, ... of the wrapped dataset
+        if name == 'dataset':
+            raise AttributeError(name)
+        return getattr(self.dataset, name)
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        return tuple(self.dataset[index]) + (index,)
+
+    def __getitems__(self, indices):
+        if not hasattr(self.dataset, '__getitems__'):
+            return [self[i] for i in indices]
+        batch = self.dataset.__getitems__(indices)
+        if isinstance(batch, tuple):
+            return batch + (torch.as_tensor(indices, dtype=torch.int64),)
+        return [tuple(sample) + (i,) for sample, i in zip(batch, indices)]
+
+
+class SumTree:
+    """
+    Array backed binary sum tree over n non-negative priorities.
+    sample draws a batch of leaves proportionally to their priority and update rewrites a batch of
+    leaves, both in O(k log n) with one vectorized NumPy step per tree level.
+    """
+
+    def __init__(self, priorities):
+        priorities = np.asarray(priorities, dtype=np.float64)
+        self.n = len(priorities)
+        self.depth = max(1, int(np.ceil(np.log2(max(self.n, 1)))))
+        self.capacity = 1 << self.depth
+        self.tree = np.zeros(2 * self.capacity, dtype=np.float64)
+        self.tree[self.capacity:self.capacity + self.n] = priorities
+        for level in range(self.depth - 1, -1, -1):
+            start = 1 << level
+            self.tree[start:2 * start] = self.tree[2 * start:4 * start:2] + self.tree[2 * start + 1:4 * start:2]
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    @property
+    def priorities(self):
+        return self.tree[self.capacity:self.capacity + self.n]
+
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices, dtype=np.int64) + self.capacity
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes >> 1)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def sample(self, rng, k):
+        # k prefix sums in [0, total), walked down from the root
+        value = rng.random(k) * self.total
+        nodes = np.ones(k, dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            right = value >= self.tree[left]
+            value = np.where(right, value - self.tree[left], value)
+            nodes = left + right
+        # float round-off can step past the last non-zero leaf
+        return np.minimum(nodes - self.capacity, self.n - 1)
+
+
+class PrioritySampler(EpochSampler):
+    """
+    Samples with replacement proportionally to a priority that the training loop keeps up to date,
+    so hard or tail examples are over-sampled as training goes instead of by a fixed balancing rule.
+
+    update(losses, indices) folds per-sample losses into an EMA per sample (per_class=False) or per class
+    (per_class=True, samples of a class are then drawn uniformly), the priority is (ema + eps) ** alpha.
+    indices are the dataset indices of the losses, load the dataset through WithIndices so that every batch
+    carries them: prefetching, skipped or extra (validation) batches can not shift losses onto other samples.
+
+    Indices are drawn lazily in chunks of chunk_size from the current sum tree, so updates take effect
+    within the same epoch; num_samples defaults to len(dataset). The state also holds the EMAs, a restored
+    sampler draws the rest of the interrupted epoch from them (the draws themselves depend on the updates).
+    """
+
+    def __init__(self, dataset, num_samples=None, per_class=False, alpha=1., momentum=0.9, eps=1e-3,
+                 chunk_size=1024, seed=None, class_index=None):
+        super(PrioritySampler, self).__init__(seed)
+        class_index = ClassIndex.of(dataset) if class_index is None else class_index
+        self.class_index = class_index
+        self.per_class = per_class
+        self.alpha = alpha
+        self.momentum = momentum
+        self.eps = eps
+        self.chunk_size = chunk_size
+        self.num_samples = len(class_index.indices) if num_samples is None else num_samples
+
+        if per_class:
+            # position of every sample's class in class_index.classes
+            self.sample_class = np.empty(len(class_index.indices), dtype=np.int64)
+            self.sample_class[class_index.indices] = np.repeat(np.arange(len(class_index)), class_index.counts)
+            self.ema = np.ones(len(class_index))
+        else:
+            self.ema = np.ones(len(class_index.indices))
+        self.tree = SumTree(self._priority(self.ema))
+
+    def _priority(self, ema):
+        return (ema + self.eps) ** self.alpha
+
+    def state_dict(self):
+        state = super(PrioritySampler, self).state_dict()
+        state['ema'] = self.ema.copy()
+        return state
+
+    def load_state_dict(self, state):
+        super(PrioritySampler, self).load_state_dict(state)
+        self.ema = np.array(state['ema'], dtype=np.float64)
+        self.tree = SumTree(self._priority(self.ema))
+
+    def update(self, losses, indices):
+        if indices is None:
+            raise ValueError("PrioritySampler.update needs the dataset indices of the losses, see WithIndices")
+        losses = np.asarray(torch.as_tensor(losses).detach().float().cpu(), dtype=np.float64).reshape(-1)
+        indices = np.asarray(torch.as_tensor(indices).cpu(), dtype=np.int64).reshape(-1)
+        if len(indices) != len(losses):
+            raise ValueError("got {} losses for {} indices".format(len(losses), len(indices)))
+
+        if self.per_class:
+            # mean loss of every class present in the batch
+            cls = self.sample_class[indices]
+            keys = np.unique(cls)
+            cls = np.searchsorted(keys, cls)
+            mean = np.bincount(cls, weights=losses, minlength=len(keys)) / np.bincount(cls, minlength=len(keys))
+            indices, losses = keys, mean
+        else:
+            # a sample drawn several times in the batch counts once, with its last loss
+            indices, last = np.unique(indices[::-1], return_index=True)
+            losses = losses[::-1][last]
+
+        self.ema[indices] = self.momentum * self.ema[indices] + (1 - self.momentum) * losses
+        self.tree.update(indices, self._priority(self.ema[indices]))
+
+    def _draw(self, rng, k):
+        drawn = self.tree.sample(rng, k)
+        if not self.per_class:
+            return drawn
+        # uniform sample inside each drawn class
+        offsets, counts = self.class_index.offsets[drawn], self.class_index.counts[drawn]
+        return self.class_index.indices[offsets + (rng.random(k) * counts).astype(np.int64)]
+
+    def __iter__(self):
+        epoch, offset = self._next_epoch()
+        rng = np.random.default_rng([self.seed, epoch, offset])
+        for start in range(offset, self.num_samples, self.chunk_size):
+            yield from self._draw(rng, min(self.chunk_size, self.num_samples - start)).tolist()
+
+    def __len__(self):
+        return self.num_samples
+
 
 if __name__ == "__main__":
     from torchvision.datasets import CIFAR10, MNIST, FashionMNIST
@@ -0,0 +1,149 @@
+import io
+import os
+import json
+import random
+import tarfile
+import numpy as np
+from torch.utils.data import IterableDataset, get_worker_info
+from datasets.decode import open_image
+
+
+# Shard layout: <out_dir>/<prefix>-00000.tar, ... plus <out_dir>/<prefix>.json.
+# Every sample is a pair of consecutive tar members, <key>.<ext> with the untouched encoded image
+# and <key>.cls with the label as text, so a shard is read with one sequential pass.
+# The json index lists every shard with its labels, which gives len() and class counts without a scan.
+
+
+def _add_member(tar, name, payload):
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    info.mode = 0o444
+    tar.addfile(info, io.BytesIO(payload))
+
+
+def write_shards(samples, out_dir, prefix, shard_size=5000):
+    """
+    Packs (image path, label) samples, in the given order, into tar shards of shard_size samples.
+    Shuffle the list first if shards should not be sorted by class.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    shards = []
+    tar = None
+    for i, (path, label) in enumerate(samples):
+        if i % shard_size == 0:
+            if tar is not None:
+                tar.close()
+            name = '{}-{:05d}.tar'.format(prefix, len(shards))
+            tar = tarfile.open(os.path.join(out_dir, name), 'w')
+            shards.append({'name': name, 'labels': []})
+        key = '{:08d}'.format(i)
+        ext = os.path.splitext(path)[1].lower() or '.jpg'
+        with open(path, 'rb') as f:
+            _add_member(tar, key + ext, f.read())
+        _add_member(tar, key + '.cls', str(int(label)).encode())
+        shards[-1]['labels'].append(int(label))
+    if tar is not None:
+        tar.close()
+
+    index_path = os.path.join(out_dir, prefix + '.json')
+    tmp = index_path + '.{}.tmp'.format(os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump({'shards': shards}, f)
+    os.replace(tmp, index_path)
+    return index_path
+
+
+def read_shard(path):
+    """Yields (encoded image bytes, label) pairs of one shard in a single sequential pass."""
+    with tarfile.open(path, 'r|') as tar:
+        image = None
+        for member in tar:
+            payload = tar.extractfile(member).read()
+            if member.name.endswith('.cls'):
+                yield image, int(payload)
+                image = None
+            else:
+                image = payload
+
+
+class ShardedImageDataset(IterableDataset):
+    """
+    Streams the samples of a write_shards index.
+
+    Every DataLoader worker reads its own shards (shard i goes to worker i % num_workers) front to back.
+    With shuffle the shard order is reshuffled per epoch and, if shuffle_buffer > 0, samples are also
+    mixed through a shuffle_buffer sized buffer; shuffle=False reads shards and samples in index order.
+    decode_size turns on reduced-size JPEG decoding (datasets.decode.open_image).
+    The epoch advances on every __iter__ unless set_epoch is called, like BalancedSampler; with
+    num_workers > 0 the workers iterate copies of the dataset, so call set_epoch before every epoch.
+    """
+
+    def __init__(self, index_path, transform=None, target_transform=None, shuffle=True, shuffle_buffer=0, seed=None,
+                 decode_size=None):
+        with open(index_path) as f:
+            index = json.load(f)
+        root = os.path.dirname(index_path)
+        self.shards = [os.path.join(root, shard['name']) for shard in index['shards']]
+        self.shard_sizes = [len(shard['labels']) for shard in index['shards']]
+        self.targets = np.concatenate([np.asarray(shard['labels'], dtype=np.int64) for shard in index['shards']]
+                                      or [np.zeros(0, dtype=np.int64)])
+        self.transform = transform
+        self.target_transform = target_transform
+        self.shuffle = shuffle
+        self.shuffle_buffer = shuffle_buffer
+        self.decode_size = decode_size
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def get_cls_num_list(self):
+        return np.bincount(self.targets).tolist()
+
+    def __len__(self):
+        return len(self.targets)
+
+    def _worker_shards(self, rng):
+        shards = list(self.shards)
+        if self.shuffle:
+            rng.shuffle(shards)
+        worker = get_worker_info()
+        if worker is not None:
+            shards = shards[worker.id::worker.num_workers]
+        return shards
+
+    def _samples(self, shards):
+        for shard in shards:
+            yield from read_shard(shard)
+
+    def _shuffled(self, samples, rng):
+        buffer = []
+        for sample in samples:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(sample)
+                continue
+            i = rng.randrange(len(buffer))
+            yield buffer[i]
+            buffer[i] = sample
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def __iter__(self):
+        # every worker sees the same shard permutation, the buffer is mixed per worker
+        rng = random.Random(self.seed * 1000003 + self.epoch)
+        shards = self._worker_shards(rng)
+        worker = get_worker_info()
+        rng = random.Random((self.seed * 1000003 + self.epoch) * 1009 + (worker.id if worker is not None else 0))
+        self.epoch += 1
+
+        samples = self._samples(shards)
+        if self.shuffle and self.shuffle_buffer > 0:
+            samples = self._shuffled(samples, rng)
+        for payload, label in samples:
+            img = open_image(payload, self.decode_size)
+            if self.transform is not None:
+                img = self.transform(img)
+            if self.target_transform is not None:
+                label = self.target_transform(label)
+            yield img, label
@@ -0,0 +1,40 @@
+import torch
+import numpy as np
+
+
+class SharedMemoryMixin:
+    """
+    Moves data and targets into torch shared memory, targets as one int64 array instead of a list.
+
+    Forked DataLoader workers would otherwise un-share the copy-on-write pages of a targets list (every
+    access writes a refcount) and spawned workers would get a pickled copy of everything. NumPy fields
+    stay NumPy arrays (views of the shared tensors, so __getitem__ is unchanged) and are pickled as the
+    shared tensors, which torch hands to workers as shared-memory handles.
+    """
+
+    _shared_fields = ('data', 'targets')
+
+    def share_memory_(self):
+        self._shared = {}
+        for name in self._shared_fields:
+            value = getattr(self, name)
+            if torch.is_tensor(value):
+                value.share_memory_()
+                continue
+            array = np.array(value, dtype=np.int64 if name == 'targets' else None, order='C')
+            tensor = torch.from_numpy(array).share_memory_()
+            self._shared[name] = tensor
+            setattr(self, name, tensor.numpy())
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in state.get('_shared', {}):
+            # rebuilt from the shared tensor in __setstate__
+            state[name] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for name, tensor in state.get('_shared', {}).items():
+            setattr(self, name, tensor.numpy())
@@ -0,0 +1,126 @@
+import os
+import json
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RunningStats:
+    """
+    Per-channel pixel count / mean / M2 (sum of squared deviations) in float64.
+
+    Chunks are reduced on their own and combined with Chan et al.'s parallel update (Welford's update
+    generalized to a whole chunk), so the result does not depend on how the dataset was split and
+    never needs more than one chunk in memory.
+    """
+
+    def __init__(self, num_channels):
+        self.count = 0
+        self.mean = np.zeros(num_channels)
+        self.m2 = np.zeros(num_channels)
+
+    @classmethod
+    def of(cls, pixels):
+        # pixels: (N, C, H * W)
+        stats = cls(pixels.shape[1])
+        stats.count = pixels.shape[0] * pixels.shape[2]
+        if stats.count > 0:
+            stats.mean = pixels.mean(axis=(0, 2))
+            stats.m2 = np.square(pixels - stats.mean[:, None]).sum(axis=(0, 2))
+        return stats
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / count)
+        self.m2 = self.m2 + other.m2 + np.square(delta) * (self.count * other.count / count)
+        self.count = count
+        return self
+
+    @property
+    def std(self):
+        # population std, the same convention as the usual CIFAR constants
+        return np.sqrt(self.m2 / max(self.count, 1))
+
+    def to_dict(self):
+        return {'count': int(self.count), 'mean': self.mean.tolist(), 'std': self.std.tolist()}
+
+
+def _pixels(images):
+    # uint8 (N, H, W) or (N, H, W, C) -> float64 (N, C, H * W) in [0, 1], the scale of ToTensor
+    images = np.asarray(images)
+    if images.ndim == 3:
+        images = images[..., None]
+    n, c = images.shape[0], images.shape[-1]
+    return images.reshape(n, -1, c).transpose(0, 2, 1) / 255.
+
+
+def _chunk_stats(data, targets, start, stop):
+    pixels = _pixels(data[start:stop])
+    total = RunningStats.of(pixels)
+    per_class = {}
+    if targets is not None:
+        labels = np.asarray(targets[start:stop])
+        for label in np.unique(labels):
+            per_class[int(label)] = RunningStats.of(pixels[labels == label])
+    return total, per_class
+
+
+def compute_stats(data, targets=None, chunk_size=1024, num_workers=0):
+    """
+    Per-channel mean / std of a uint8 image array (dataset.data) in one streaming pass.
+
+    With targets, the statistics of every class are accumulated in the same pass under 'classes'.
+    Chunks are reduced on num_workers threads (NumPy releases the GIL) and merged in order.
+    """
+    def work(start):
+        return _chunk_stats(data, targets, start, min(start + chunk_size, len(data)))
+
+    starts = range(0, len(data), chunk_size)
+    if num_workers > 0:
+        executor = ThreadPoolExecutor(num_workers)
+        results = executor.map(work, starts)
+    else:
+        executor = None
+        results = map(work, starts)
+
+    total, per_class = None, {}
+    for chunk_total, chunk_per_class in results:
+        total = chunk_total if total is None else total.merge(chunk_total)
+        for label, stats in chunk_per_class.items():
+            per_class[label] = per_class[label].merge(stats) if label in per_class else stats
+    if executor is not None:
+        executor.shutdown()
+
+    result = total.to_dict()
+    if targets is not None:
+        result['classes'] = {str(label): per_class[label].to_dict() for label in sorted(per_class)}
+    return result
+
+
+def load_or_compute_stats(path, data, targets=None, **kwargs):
+    """compute_stats cached as path/stats.json, recomputed only if per-class stats are asked for and missing."""
+    filename = os.path.join(path, 'stats.json')
+    if os.path.exists(filename):
+        with open(filename) as f:
+            stats = json.load(f)
+        if targets is None or 'classes' in stats:
+            return stats
+
+    stats = compute_stats(data, targets, **kwargs)
+    tmp = filename + '.{}.tmp'.format(os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(stats, f)
+    os.replace(tmp, filename)
+    return stats
+
+
+if __name__ == '__main__':
+    import sys
+    from datasets.cache import CachedImageDataset
+
+    # python -m datasets.stats <cache entry> [...]
+    for path in sys.argv[1:]:
+        dataset = CachedImageDataset(path)
+        print(path, json.dumps(dataset.stats(per_class=True), indent=2))
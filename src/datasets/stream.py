@@ -0,0 +1,43 @@
+class BatchStream:
+    """
+    Endless stream of the batches of a DataLoader, cut to a budget of steps.
+
+    The loader's iterator is kept from one step to the next and only rebuilt when an epoch runs out,
+    which reshuffles it (shuffle=True or the epoch counter of the datasets.sampler samplers). With
+    persistent_workers=True the worker processes survive that as well. Training length is counted in
+    steps, so samplers that inflate the epoch (BalancedSampler) do not change it.
+    Iterating yields the remaining steps of the budget, next(stream) takes a single batch.
+    """
+
+    def __init__(self, loader, steps=None):
+        self.loader = loader
+        self.steps = steps
+        self.step = 0
+        self.epoch = 0
+        self._iterator = None
+
+    def __len__(self):
+        if self.steps is None:
+            raise TypeError("BatchStream without a step budget has no length")
+        return self.steps
+
+    def __iter__(self):
+        while self.steps is None or self.step < self.steps:
+            yield next(self)
+
+    def __next__(self):
+        if self.steps is not None and self.step >= self.steps:
+            raise StopIteration
+        if self._iterator is None:
+            self._iterator = iter(self.loader)
+        try:
+            batch = next(self._iterator)
+        except StopIteration:
+            self.epoch += 1
+            self._iterator = iter(self.loader)
+            try:
+                batch = next(self._iterator)
+            except StopIteration:
+                raise ValueError("the loader yields no batch") from None
+        self.step += 1
+        return batch
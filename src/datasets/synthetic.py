@@ -0,0 +1,176 @@
+import torch
+import numpy as np
+from PIL import Image
+from torch.utils.data import Dataset
+from datasets.imbalance import imbalanced_counts, imbalanced_indices
+from datasets.shared import SharedMemoryMixin
+
+
+def _templates(cls_num, shape, seed):
+    # one smooth pattern per class (4x4 random colors upsampled), so classifiers still have something to learn
+    rng = np.random.default_rng([seed, cls_num])
+    h, w = shape[:2]
+    coarse = rng.integers(0, 256, (cls_num, 4, 4) + tuple(shape[2:])).astype(np.float32)
+    rows = np.arange(h) * 4 // h
+    cols = np.arange(w) * 4 // w
+    return coarse[:, rows][:, :, cols]
+
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(x):
+    # splitmix64 finalizer, uint64 arithmetic wraps around
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _noise(seed, ids, shape):
+    # counter-based uint8 in [0, 64): a hash of (seed, image id, counter), for all ids in one pass,
+    # each uint64 hash gives the bytes of 8 pixels
+    size = int(np.prod(shape))
+    keys = _mix((np.uint64(seed) * _GOLDEN) ^ np.asarray(ids, dtype=np.uint64))
+    counters = np.arange((size + 7) // 8, dtype=np.uint64) * _GOLDEN
+    words = _mix(keys[:, None] + counters[None, :]).astype('<u8', copy=False)
+    noise = words.view(np.uint8)[:, :size] & np.uint8(63)
+    return noise.reshape((len(keys),) + tuple(shape))
+
+
+class SyntheticImages:
+    """
+    Deterministic fake uint8 images, rendered when indexed: image i of class y is the template of y plus
+    uniform noise hashed from (seed, i, pixel), whatever the batch or worker it is read in.
+    Indexed like the .data arrays of the torchvision datasets, np.asarray(images) renders all of them.
+    """
+
+    chunk_size = 1024
+
+    def __init__(self, ids, labels, templates, seed):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.templates = templates
+        # template * 0.75 + noise floored, precomputed: at most 191 + 63, no clipping needed
+        self.scaled = np.ascontiguousarray(templates * 0.75, dtype=np.uint8)
+        self.seed = seed
+        self.shape = (len(self.ids),) + templates.shape[1:]
+        self.dtype = np.dtype(np.uint8)
+        self.ndim = len(self.shape)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def render(self, ids, labels):
+        shape = self.templates.shape[1:]
+        out = np.empty((len(ids),) + shape, dtype=np.uint8)
+        # chunked, to bound the uint64 temporaries
+        for start in range(0, len(ids), self.chunk_size):
+            stop = start + self.chunk_size
+            np.add(self.scaled[labels[start:stop]], _noise(self.seed, ids[start:stop], shape), out=out[start:stop])
+        return out
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.render(self.ids[[index]], self.labels[[index]])[0]
+        return self.render(self.ids[index], self.labels[index])
+
+    def __array__(self, dtype=None, copy=None):
+        images = self.render(self.ids, self.labels)
+        return images if dtype is None else images.astype(dtype)
+
+
+class Synthetic_CIFAR10(SharedMemoryMixin, Dataset):
+    """
+    Offline stand-in for Imbalanced_CIFAR10: same constructor, data / targets / get_cls_num_list and PIL
+    based transform, over deterministic fake images (SyntheticImages) instead of the downloaded files.
+
+    root and download are accepted and ignored. The balanced full set has num_train / num_test images
+    (targets i % cls_num) and the imbalanced subset is taken with the same imbalanced_indices as the
+    real datasets. With in_memory the images are rendered once into shared memory, otherwise on access.
+    """
+
+    cls_num = 10
+    image_shape = (32, 32, 3)
+    num_train = 50000
+    num_test = 10000
+
+    def __init__(self, root=None, imb_type='exp', imb_factor=0.01, rand_number=0, train=True,
+                 transform=None, target_transform=None, download=False, reverse=False, in_memory=True):
+        self.root = root
+        self.train = train
+        self.transform = transform
+        self.target_transform = target_transform
+        self.classes = [str(i) for i in range(self.cls_num)]
+
+        num_images = self.num_train if train else self.num_test
+        # disjoint image ids, the test images are not copies of training images
+        ids = np.arange(num_images) + (0 if train else self.num_train)
+        labels = ids % self.cls_num
+        np.random.seed(rand_number)
+        img_num_list = imbalanced_counts(num_images / self.cls_num, self.cls_num, imb_type, imb_factor, reverse)
+        selec_idx, self.num_per_cls_dict = imbalanced_indices(labels, img_num_list)
+        self.reverse = reverse
+
+        images = SyntheticImages(ids[selec_idx], labels[selec_idx], _templates(self.cls_num, self.image_shape, 0),
+                                 rand_number)
+        self.data = self._as_data(np.asarray(images)) if in_memory else images
+        self.targets = self._as_targets(labels[selec_idx])
+        if in_memory:
+            self.share_memory_()
+
+    def _as_data(self, images):
+        return images
+
+    def _as_targets(self, labels):
+        return labels
+
+    @property
+    def train_labels(self):
+        return self.targets
+
+    def get_cls_num_list(self):
+        return [self.num_per_cls_dict[i] for i in range(self.cls_num)]
+
+    def __len__(self):
+        return len(self.targets)
+
+    def _to_image(self, img):
+        return Image.fromarray(np.asarray(img))
+
+    def __getitem__(self, index):
+        img, target = self.data[index], int(self.targets[index])
+        img = self._to_image(img)
+
+        if self.transform is not None:
+            img = self.transform(img)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+        return img, target
+
+
+class Synthetic_CIFAR100(Synthetic_CIFAR10):
+    cls_num = 100
+
+
+class Synthetic_MNIST(Synthetic_CIFAR10):
+    """Stand-in for Imbalanced_MNIST: (N, 28, 28) uint8 data and int64 targets as tensors, 'L' mode images."""
+
+    image_shape = (28, 28)
+    num_train = 60000
+    num_test = 10000
+
+    def _as_data(self, images):
+        return torch.from_numpy(images)
+
+    def _as_targets(self, labels):
+        return torch.from_numpy(labels)
+
+
+if __name__ == '__main__':
+    import time
+
+    for dataset_cls in (Synthetic_CIFAR10, Synthetic_MNIST):
+        start = time.perf_counter()
+        dataset = dataset_cls(imb_factor=0.01)
+        print(dataset_cls.__name__, len(dataset), tuple(dataset.data.shape), dataset.get_cls_num_list(),
+              time.perf_counter() - start)
@@ -0,0 +1,90 @@
+import torch
+import numpy as np
+import torch.nn.functional as F
+from torch.utils.data import Dataset, DataLoader
+
+
+def to_uint8_nchw(data, image_size=None):
+    """CIFAR style (N, H, W, C) numpy or MNIST style (N, H, W) tensor -> contiguous uint8 (N, C, H, W) tensor."""
+    data = torch.as_tensor(np.array(data, dtype=np.uint8))
+    if data.dim() == 3:
+        data = data.unsqueeze(1)
+    else:
+        data = data.permute(0, 3, 1, 2)
+
+    if image_size is not None and tuple(data.shape[-2:]) != (image_size, image_size):
+        # transforms.Resize is applied once here instead of on every access
+        data = F.interpolate(data.float(), size=(image_size, image_size), mode='bilinear',
+                             align_corners=False, antialias=True)
+        data = data.round_().clamp_(0, 255).to(torch.uint8)
+    return data.contiguous()
+
+
+class InMemoryImageDataset(Dataset):
+    """
+    Keeps an (imbalanced) image dataset as one contiguous uint8 tensor.
+
+    __getitems__ fetches a whole batch with one gather and normalizes it in one shot, so a DataLoader
+    built with batch_collate skips the per-item PIL conversion, ToTensor, Normalize and default_collate.
+    Random augmentation has to be batched as well (datasets.batch_transforms), transform gets the
+    raw [0, 255] batch before normalization and may return a list of views (BatchTwoCrop).
+    With mean=None / std=None the batches are not normalized and stay uint8 (unless a color transform
+    returned float), to be normalized on device by the model (models.normalize.InputNormalize).
+    """
+
+    def __init__(self, dataset, mean=None, std=None, image_size=None, transform=None):
+        self.data = to_uint8_nchw(dataset.data, image_size)
+        self.targets = torch.as_tensor(np.array(dataset.targets, dtype=np.int64))
+        self.transform = transform
+
+        self.scale = self.shift = None
+        if mean is not None:
+            channel = self.data.size(1)
+            mean = torch.as_tensor(mean, dtype=torch.float32).expand(channel).view(1, channel, 1, 1)
+            std = torch.as_tensor(std, dtype=torch.float32).expand(channel).view(1, channel, 1, 1)
+            # (x / 255 - mean) / std == x * scale + shift
+            self.scale = 1. / (255. * std)
+            self.shift = -mean / std
+
+        if hasattr(dataset, 'get_cls_num_list'):
+            self.get_cls_num_list = dataset.get_cls_num_list
+        if hasattr(dataset, 'class_index'):
+            # same sample order, the samplers can keep using the wrapped dataset's index
+            self.class_index = dataset.class_index
+
+    def __len__(self):
+        return len(self.targets)
+
+    def normalize(self, images):
+        if self.scale is None:
+            return images
+        return torch.addcmul(self.shift, images.float(), self.scale)
+
+    def __getitems__(self, indices):
+        indices = torch.as_tensor(indices, dtype=torch.int64)
+        images = self.data.index_select(0, indices)
+        if self.transform is not None:
+            images = self.transform(images)
+        if isinstance(images, (list, tuple)):
+            images = [self.normalize(view) for view in images]
+        else:
+            images = self.normalize(images)
+        return images, self.targets.index_select(0, indices)
+
+    def __getitem__(self, index):
+        images, targets = self.__getitems__([index])
+        if isinstance(images, list):
+            return [view[0] for view in images], targets[0]
+        return images[0], targets[0]
+
+
+def batch_collate(batch):
+    # InMemoryImageDataset.__getitems__ already returns a collated (images, targets) batch
+    return batch
+
+
+def in_memory_loader(dataset, batch_size=1, **kwargs):
+    """DataLoader over an InMemoryImageDataset, any sampler / batch_sampler keyword of DataLoader still applies."""
+    if kwargs.get('batch_sampler') is not None:
+        return DataLoader(dataset, collate_fn=batch_collate, **kwargs)
+    return DataLoader(dataset, batch_size=batch_size, collate_fn=batch_collate, **kwargs)
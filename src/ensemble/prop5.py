@@ -17,6 +17,7 @@ from torchsummaryX import summary
 from utiles.tensorboard import getTensorboard
 from utiles.data import getSubDataset
 from utiles.imbalance_cifar10_loader import ImbalanceCIFAR10DataLoader
+from datasets.prefetch import DevicePrefetcher, list_collate
 from models.resnet_s import resnet32
 # from models.cDCGAN import Generator
 from models.myGAN import Generator
@@ -45,13 +46,19 @@ tb = getTensorboard(tensorboard_path)
 # Define DataLoader
 train_data_loader = ImbalanceCIFAR10DataLoader(data_dir='../../data',
                                               batch_size=batch_size,
-                                              shuffle=True, num_workers=num_workers, training=True, imb_factor=0.01)
+                                              shuffle=True, num_workers=num_workers, training=True, imb_factor=0.01,
+                                              collate_fn=list_collate)
 
 test_data_loader = ImbalanceCIFAR10DataLoader(data_dir='../../data',
                                               batch_size=batch_size,
-                                              shuffle=False, num_workers=num_workers, training=False)
+                                              shuffle=False, num_workers=num_workers, training=False,
+                                              collate_fn=list_collate)
 
 
+# batches are staged and copied to the device on a background thread
+train_prefetcher = DevicePrefetcher(train_data_loader, device)
+test_prefetcher = DevicePrefetcher(test_data_loader, device)
+
 print("Number of train dataset", len(train_data_loader.dataset))
 print("Number of test dataset", len(test_data_loader.dataset))
 
@@ -191,7 +198,7 @@ log = {}
 total_step = len(train_data_loader)
 for epoch in range(num_epochs):
     test_accuracy = 0
-    for i, (images, labels) in enumerate(train_data_loader):
+    for i, (images, labels) in enumerate(train_prefetcher):
         # images = images.reshape(batch_size, -1).to(device)
         batch = images.size(0)
         images = images.to(device)
@@ -269,7 +276,7 @@ for epoch in range(num_epochs):
                 print(f'{l_name}: {l_value:.4}')
 
 
-    for test_idx, data in enumerate(test_data_loader):
+    for test_idx, data in enumerate(test_prefetcher):
         img, target = data
         img, target = img.to(device), target.to(device)
         batch = img.size(0)
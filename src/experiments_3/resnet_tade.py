@@ -15,6 +15,8 @@ import seaborn as sns
 from utiles.tensorboard import getTensorboard
 from utiles.data import getSubDataset
 from utiles.imbalance_cifar10_loader import ImbalanceCIFAR10DataLoader
+from datasets.prefetch import DevicePrefetcher, list_collate
+from utiles.metrics import MetricAccumulator
 from models.expert_resnet_cifar import resnet32
 from loss import DiverseExpertLoss
 
@@ -49,15 +51,21 @@ train_data_loader = ImbalanceCIFAR10DataLoader(data_dir='../../data',
                                               shuffle=True,
                                               num_workers=num_workers,
                                               training=True,
-                                              imb_factor=imb_factor)
+                                              imb_factor=imb_factor,
+                                              collate_fn=list_collate)
 
 test_data_loader = ImbalanceCIFAR10DataLoader(data_dir='../../data',
                                               batch_size=batch_size,
                                               shuffle=False,
                                               num_workers=num_workers,
-                                              training=False)
+                                              training=False,
+                                              collate_fn=list_collate)
 
 
+# batches are staged and copied to the device on a background thread
+train_prefetcher = DevicePrefetcher(train_data_loader, device)
+test_prefetcher = DevicePrefetcher(test_data_loader, device)
+
 print("Number of train dataset", len(train_data_loader.dataset))
 print("Number of test dataset", len(test_data_loader.dataset))
 
@@ -133,7 +141,9 @@ for epoch in range(num_epochs):
     test_loss = 0.0
     test_accuracy = 0.0
 
-    for train_idx, data in enumerate(train_data_loader):
+    # train loss / accuracy summed on device, read once per epoch
+    train_metrics = MetricAccumulator()
+    for train_idx, data in enumerate(train_prefetcher):
         img, target = data
         img, target = img.to(device), target.to(device)
         batch = img.size(0)
@@ -156,16 +166,16 @@ for epoch in range(num_epochs):
         optimizer.step()
 
 
-        train_loss += loss.item()
         pred = output.argmax(dim=1)
-        train_accuracy += torch.sum(pred == target).item()
+        train_metrics.update('loss', loss)
+        train_metrics.update_sum('accuracy', torch.sum(pred == target), batch)
         # print(f"epochs: {epoch}, iter: {train_idx}/{len(train_data_loader)}, loss: {loss.item()}")
 
     test_target = np.array([])
     test_predict = np.array([])
     model.eval()
     with torch.no_grad():
-        for test_idx, data in enumerate(test_data_loader):
+        for test_idx, data in enumerate(test_prefetcher):
             img, target = data
             img, target = img.to(device), target.to(device)
             batch = img.size(0)
@@ -220,9 +230,10 @@ for epoch in range(num_epochs):
     # print('test_loss', test_loss)
     # print('len', len(test_data_loader))
 
-    train_loss = train_loss/len(train_data_loader)
+    train_log = train_metrics.flush()
+    train_loss = train_log['loss']
     test_loss = test_loss/len(test_data_loader)
-    train_accuracy = train_accuracy/len(train_data_loader.dataset)
+    train_accuracy = train_log['accuracy']
     test_accuracy = test_accuracy/len(test_data_loader.dataset)
 
     print(len(train_data_loader))
@@ -10,6 +10,7 @@ from torch.utils.tensorboard import SummaryWriter
 from utiles.imbalance_mnist_loader import ImbalanceMNISTDataLoader
 import matplotlib.pyplot as plt
 from functools import reduce
+from gan.step_context import StepContext
 
 # Device configuration
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -109,16 +110,19 @@ class NormalNLLLoss:
 
         return nll
 
+# noise buffer allocated once on device, the z / one-hot / continuous parts are refilled in place every step
+step = StepContext(batch_size, device, noise_shape=(num_z + dis_c_dim + num_con_c, 1, 1), num_classes=dis_c_dim)
+
 def getNoiseSample(dis_c_dim, num_con_c, num_z, batch_size):
-    z = torch.randn(batch_size, num_z, 1, 1)
+    # [z, dis_c, con_c] along dim 1, written straight into one device buffer (overwritten by the next call)
+    noise = step.noise(batch_size)
 
-    idx = (torch.rand((batch_size, 1)) * dis_c_dim).type_as(torch.LongTensor())
-    dis_c = torch.zeros(batch_size, dis_c_dim).scatter_(1, idx, 1.0).view(batch_size, dis_c_dim, 1, 1)
+    idx = step.labels(batch_size, dis_c_dim).view(batch_size, 1)
+    noise[:, num_z:num_z + dis_c_dim].zero_().scatter_(1, idx.view(batch_size, 1, 1, 1), 1.0)
     # dis_c = (torch.rand(batch_size, dis_c_dim, 1, 1) * 10).type_as(torch.LongTensor())
-    con_c = torch.rand(batch_size, num_con_c, 1, 1) * 2 - 1
+    noise[:, num_z + dis_c_dim:].uniform_(-1, 1, generator=step.generator)
 
-    noise = torch.cat([z, dis_c, con_c], dim = 1)
-    return noise.to(device), idx.to(device)
+    return noise, idx
 
 
 # Generator
@@ -361,8 +365,8 @@ for epoch in range(epochs):
         # images = images.reshape(_batch, -1).to(device)
         images = images.to(device)
 
-        real_labels = torch.ones(_batch, 1).to(device)
-        fake_labels = torch.zeros(_batch, 1).to(device)
+        real_labels = step.real_labels(_batch)
+        fake_labels = step.fake_labels(_batch)
         # z = torch.randn(_batch, noise_dim, 1, 1).to(device)  # mean==0, std==1
 
         # ================================================================== #
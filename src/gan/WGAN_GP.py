@@ -12,6 +12,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 from pathlib import Path
 
+from datasets.stream import BatchStream
+
 print(torch.cuda.is_available())
 isUse_cuda = torch.cuda.is_available()
 device = torch.device('cuda' if isUse_cuda else 'cpu')
@@ -46,9 +48,10 @@ dataset = MNIST(root=DATAPATH, train=True, download=True, transform=transform)
 print(dataset[0][0].min(), dataset[0][0].max())
 
 
-loader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
-iters = iter(loader)
-img, label = iters.next()
+# full batches only, the latent batch has a fixed size
+loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, drop_last=True)
+# one iterator for the whole run, rebuilt (and reshuffled) only at the end of an epoch
+stream = BatchStream(loader, max_iters - start_iters)
 
 ###
 # Define Models
@@ -129,9 +132,7 @@ def compute_gradient_penalty(D, real_samples, fake_samples):
     return gradient_penalty
 
 
-for i in range(start_iters, max_iters):
-    iter_loader = iter(loader)
-    real_img_ori, _ = iter_loader.next()
+for i, (real_img_ori, _) in enumerate(stream, start_iters):
     real_img = real_img_ori.reshape(-1, image_size).to(device)
 
     latent_input = getLatentVector(batch_size).to(device)
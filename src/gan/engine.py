@@ -0,0 +1,284 @@
+import time
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from models.batchnorm import convert_split_bn, split_batch_norm
+from datasets.stream import BatchStream
+from gan.step_context import StepContext
+from utiles.metrics import MetricAccumulator
+
+
+# Adversarial losses.
+# Every discriminator is expected to return raw logits (no nn.Sigmoid at the end),
+# the BCE variant is written with softplus so that no real/fake label tensors are needed:
+#   BCE(x, 1) = softplus(-x),  BCE(x, 0) = softplus(x)
+
+def d_bce_loss(real_logit, fake_logit):
+    return F.softplus(-real_logit).mean() + F.softplus(fake_logit).mean()
+
+
+def g_bce_loss(fake_logit):
+    return F.softplus(-fake_logit).mean()
+
+
+def d_hinge_loss(real_logit, fake_logit):
+    return F.relu(1. - real_logit).mean() + F.relu(1. + fake_logit).mean()
+
+
+def g_hinge_loss(fake_logit):
+    return -fake_logit.mean()
+
+
+def d_ls_loss(real_logit, fake_logit):
+    return 0.5 * ((real_logit - 1) ** 2).mean() + 0.5 * (fake_logit ** 2).mean()
+
+
+def g_ls_loss(fake_logit):
+    return 0.5 * ((fake_logit - 1) ** 2).mean()
+
+
+def d_wasserstein_loss(real_logit, fake_logit):
+    return fake_logit.mean() - real_logit.mean()
+
+
+def g_wasserstein_loss(fake_logit):
+    return -fake_logit.mean()
+
+
+ADV_LOSSES = {
+    'bce': (d_bce_loss, g_bce_loss),
+    'hinge': (d_hinge_loss, g_hinge_loss),
+    'ls': (d_ls_loss, g_ls_loss),
+    'wgan-cp': (d_wasserstein_loss, g_wasserstein_loss),
+    'wgan-gp': (d_wasserstein_loss, g_wasserstein_loss),
+}
+
+
+def split_output(output):
+    """Returns (adv_logit, cls_logit) for both plain and ACGAN style discriminators."""
+    if isinstance(output, (tuple, list)):
+        adv, cls = output
+        return adv.reshape(adv.size(0), -1), cls.reshape(cls.size(0), -1)
+    return output.reshape(output.size(0), -1), None
+
+
+def gradient_penalty(D, real_image, fake_image):
+    alpha = torch.rand(real_image.size(0), *([1] * (real_image.dim() - 1)), device=real_image.device)
+    interpolates = (alpha * real_image.detach() + (1 - alpha) * fake_image.detach()).requires_grad_(True)
+    adv, _ = split_output(D(interpolates))
+    gradients = torch.autograd.grad(outputs=adv.sum(), inputs=interpolates, create_graph=True)[0]
+    gradients = gradients.reshape(gradients.size(0), -1)
+    return ((gradients.norm(2, dim=1) - 1) ** 2).mean()
+
+
+class GANTrainer:
+    """
+    Shared training step for the GAN variants in src/gan and src/gan_modi.
+
+    G is called as G(z) or, when num_classes is given, as G(z, y) (e.g. models.generator.Generator).
+    D may return a logit tensor or an (adv_logit, cls_logit) tuple (e.g. models.resnet with discriminator=True),
+    in the latter case the auxiliary classification loss of ACGAN is added with weight lambda_cls.
+
+    With concat_d=True the D step runs real and fake through D as one concatenated batch.
+    The BatchNorm2d layers of D are then swapped for SplitBatchNorm2d so that every half
+    keeps its own statistics (bn_splits=2), bn_splits > 2 gives ghost batch norm inside each half.
+    """
+
+    def __init__(self, G, D, g_optimizer, d_optimizer, latent_dim, loss='bce', num_classes=None,
+                 noise_shape=None, n_critic=1, lambda_gp=10., clip_value=0.01, lambda_cls=1., concat_d=False, bn_splits=2, device='cpu',
+                 seed=None):
+        if loss not in ADV_LOSSES:
+            raise ValueError("loss should be one of {}, got {}".format(list(ADV_LOSSES), loss))
+        if bn_splits % 2 != 0:
+            raise ValueError("bn_splits should be a multiple of 2 so that no chunk mixes real and fake images")
+
+        if concat_d:
+            D = convert_split_bn(D)
+
+        self.G = G.to(device)
+        self.D = D.to(device)
+        self.g_optimizer = g_optimizer
+        self.d_optimizer = d_optimizer
+        self.loss = loss
+        self.d_loss_function, self.g_loss_function = ADV_LOSSES[loss]
+        self.latent_dim = latent_dim
+        self.noise_shape = tuple(noise_shape) if noise_shape is not None else (latent_dim,)
+        self.num_classes = num_classes
+        self.n_critic = n_critic
+        self.lambda_gp = lambda_gp
+        self.clip_value = clip_value
+        self.lambda_cls = lambda_cls
+        self.concat_d = concat_d
+        self.bn_splits = bn_splits
+        self.device = torch.device(device)
+        self.step = 0
+        # noise / label buffers on device, refilled in place every step
+        self.buffers = None
+        self.seed = seed
+
+    def sample_noise(self, batch_size):
+        # views of the StepContext buffers, overwritten by the next call
+        if self.buffers is None:
+            self.buffers = StepContext(batch_size, self.device, self.noise_shape, self.num_classes, seed=self.seed)
+        z = self.buffers.noise(batch_size)
+        y = self.buffers.labels(batch_size) if self.num_classes is not None else None
+        return z, y
+
+    def generate(self, z, y=None):
+        if y is None:
+            return self.G(z)
+        return self.G(z, y)
+
+    @torch.no_grad()
+    def sample(self, z, y=None):
+        self.G.eval()
+        image = self.generate(z, y)
+        self.G.train()
+        return image
+
+    def _cls_loss(self, cls_logit, label):
+        if cls_logit is None or label is None:
+            return 0.
+        return self.lambda_cls * F.cross_entropy(cls_logit, label)
+
+    def d_forward(self, real_image, fake_image):
+        if not self.concat_d:
+            return split_output(self.D(real_image)) + split_output(self.D(fake_image))
+
+        n = real_image.size(0)
+        with split_batch_norm(self.D, self.bn_splits):
+            adv, cls = split_output(self.D(torch.cat([real_image, fake_image])))
+        if cls is None:
+            return adv[:n], None, adv[n:], None
+        return adv[:n], cls[:n], adv[n:], cls[n:]
+
+    def d_step(self, real_image, real_label, fake_image, fake_label):
+        real_adv, real_cls, fake_adv, fake_cls = self.d_forward(real_image, fake_image.detach())
+
+        d_loss = self.d_loss_function(real_adv, fake_adv)
+        d_loss = d_loss + self._cls_loss(real_cls, real_label) + self._cls_loss(fake_cls, fake_label)
+        if self.loss == 'wgan-gp':
+            d_loss = d_loss + self.lambda_gp * gradient_penalty(self.D, real_image, fake_image)
+
+        self.d_optimizer.zero_grad(set_to_none=True)
+        d_loss.backward()
+        self.d_optimizer.step()
+
+        if self.loss == 'wgan-cp':
+            with torch.no_grad():
+                for p in self.D.parameters():
+                    p.clamp_(-self.clip_value, self.clip_value)
+
+        return d_loss.detach(), real_adv.detach(), fake_adv.detach()
+
+    def g_step(self, fake_image, fake_label):
+        # D weights are not updated here, skip computing their gradients
+        self.D.requires_grad_(False)
+        fake_adv, fake_cls = split_output(self.D(fake_image))
+        g_loss = self.g_loss_function(fake_adv) + self._cls_loss(fake_cls, fake_label)
+
+        self.g_optimizer.zero_grad(set_to_none=True)
+        g_loss.backward()
+        self.g_optimizer.step()
+        self.D.requires_grad_(True)
+        return g_loss.detach()
+
+    def train_step(self, real_image, real_label=None):
+        """One D update and, every n_critic steps, one G update. Returns detached loss tensors (no host sync)."""
+        real_image = real_image.to(self.device, non_blocking=True)
+        if real_label is not None and self.num_classes is not None:
+            real_label = real_label.to(self.device, non_blocking=True)
+        else:
+            real_label = None
+
+        update_g = self.step % self.n_critic == 0
+        z, fake_label = self.sample_noise(real_image.size(0))
+        # the fake batch is generated once and shared by the D step (detached) and the G step
+        with torch.set_grad_enabled(update_g):
+            fake_image = self.generate(z, fake_label)
+
+        d_loss, real_adv, fake_adv = self.d_step(real_image, real_label, fake_image, fake_label)
+        g_loss = self.g_step(fake_image, fake_label) if update_g else None
+        self.step += 1
+        return {"d_loss": d_loss, "g_loss": g_loss, "D(x)": real_adv.mean(), "D(G(z))": fake_adv.mean()}
+
+    @staticmethod
+    def _accumulate(metrics, output):
+        for key, value in output.items():
+            if value is not None:
+                metrics.update(key, value)
+
+    @staticmethod
+    def _format(metrics):
+        # the only host sync of the training loops
+        return ', '.join('{}: {:.4f}'.format(key, value) for key, value in metrics.flush().items())
+
+    def fit(self, loader, epochs, log_interval=100, on_epoch_end=None):
+        metrics = MetricAccumulator()
+        for epoch in range(epochs):
+            for i, (image, label) in enumerate(loader):
+                self._accumulate(metrics, self.train_step(image, label))
+
+                if (i + 1) % log_interval == 0:
+                    print('Epoch [{}/{}], Step [{}/{}], '.format(epoch + 1, epochs, i + 1, len(loader)) +
+                          self._format(metrics))
+            metrics.reset()
+
+            if on_epoch_end is not None:
+                on_epoch_end(self, epoch)
+
+    def fit_steps(self, loader, steps, log_interval=100, on_log=None):
+        """
+        Trains for a budget of D steps, G is updated every n_critic of them (steps=100000, n_critic=5
+        gives 20000 G steps). Batches come from one endless BatchStream of loader, so the length of
+        the run does not depend on the epoch length and no iterator is built per step.
+        """
+        stream = BatchStream(loader, steps)
+        metrics = MetricAccumulator()
+        for image, label in stream:
+            self._accumulate(metrics, self.train_step(image, label))
+
+            if stream.step % log_interval == 0:
+                print('Step [{}/{}], Epoch {}, '.format(stream.step, steps, stream.epoch + 1) +
+                      self._format(metrics))
+                if on_log is not None:
+                    on_log(self, stream.step)
+        return stream
+
+    def benchmark(self, real_image, real_label=None, steps=50, warmup=5):
+        """Steps/sec of train_step on a fixed batch, so every loss is timed on the same code path."""
+        for _ in range(warmup):
+            self.train_step(real_image, real_label)
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+        start = time.perf_counter()
+        for _ in range(steps):
+            output = self.train_step(real_image, real_label)
+        output["d_loss"].item()
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+        return steps / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    from models.generator import Generator, linear, deconv2d
+    from models.resnet_s_D import resnet32
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument("--concat_d", default=False, action='store_true')
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    batch_size = 64
+    real_image = torch.randn(batch_size, 3, 32, 32)
+
+    for loss in ADV_LOSSES:
+        G = Generator(linear=linear, deconv=deconv2d, image_size=32, image_channel=3,
+                      std_channel=64, latent_dim=128, num_classes=10, bn=True)
+        D = resnet32()
+        trainer = GANTrainer(G, D,
+                             g_optimizer=torch.optim.Adam(G.parameters(), lr=2e-4, betas=(0.5, 0.999)),
+                             d_optimizer=torch.optim.Adam(D.parameters(), lr=2e-4, betas=(0.5, 0.999)),
+                             latent_dim=128, loss=loss, num_classes=10, concat_d=args.concat_d, device=device)
+        print('{}: {:.2f} steps/sec'.format(loss, trainer.benchmark(real_image, steps=20)))
@@ -0,0 +1,72 @@
+import torch
+
+
+class StepContext:
+    """
+    Noise, class label, one-hot and real / fake target tensors of a GAN training step, allocated once on
+    the target device and refilled in place (normal_, random_, uniform_) from a dedicated torch.Generator.
+
+    Nothing is allocated or copied from the host per step. A short last batch gets a slice of the
+    buffers and a larger one grows them. The returned tensors are views of the buffers: they stay valid
+    for the step (backward included) and are overwritten by the next call, clone what has to be kept.
+    Without a seed the generator starts from torch.initial_seed(), so torch.manual_seed still makes runs
+    reproducible.
+    """
+
+    def __init__(self, batch_size, device='cpu', noise_shape=(100,), num_classes=None, seed=None):
+        self.batch_size = batch_size
+        self.device = torch.device(device)
+        self.noise_shape = tuple(noise_shape)
+        self.num_classes = num_classes
+        self.generator = torch.Generator(device=self.device)
+        self.generator.manual_seed(torch.initial_seed() if seed is None else seed)
+        self._buffers = {}
+
+    def _buffer(self, name, n, shape, dtype=torch.float32, fill=None):
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.size(0) < n or buffer.shape[1:] != tuple(shape):
+            size = max(n, self.batch_size)
+            if fill is None:
+                buffer = torch.empty((size,) + tuple(shape), dtype=dtype, device=self.device)
+            else:
+                buffer = torch.full((size,) + tuple(shape), fill, dtype=dtype, device=self.device)
+            self._buffers[name] = buffer
+        return buffer[:n]
+
+    def real_labels(self, n):
+        # constant, filled once
+        return self._buffer('ones', n, (1,), fill=1.)
+
+    def fake_labels(self, n):
+        return self._buffer('zeros', n, (1,), fill=0.)
+
+    def noise(self, n, name='z', shape=None):
+        # N(0, 1), name keeps several noise tensors of a step apart
+        return self._buffer(name, n, self.noise_shape if shape is None else shape).normal_(generator=self.generator)
+
+    def uniform(self, n, shape, low=-1., high=1., name='uniform'):
+        return self._buffer(name, n, shape).uniform_(low, high, generator=self.generator)
+
+    def labels(self, n, num_classes=None, name='labels'):
+        num_classes = self.num_classes if num_classes is None else num_classes
+        return self._buffer(name, n, (), dtype=torch.int64).random_(0, num_classes, generator=self.generator)
+
+    def one_hot(self, labels, num_classes=None, name='one_hot'):
+        # (n, num_classes) float one-hot of labels, scattered into a zeroed buffer
+        num_classes = self.num_classes if num_classes is None else num_classes
+        out = self._buffer(name, labels.size(0), (num_classes,)).zero_()
+        return out.scatter_(1, labels.view(-1, 1), 1.)
+
+    def conditioned_noise(self, labels, num_classes=None, name='z_cond'):
+        """
+        torch.cat([noise, one_hot(labels)], dim=1) written into one buffer: N(0, 1) noise_shape channels
+        followed by num_classes one-hot channels (constant over the spatial dims of noise_shape).
+        """
+        num_classes = self.num_classes if num_classes is None else num_classes
+        n, noise_dim = labels.size(0), self.noise_shape[0]
+        spatial = self.noise_shape[1:]
+        out = self._buffer(name, n, (noise_dim + num_classes,) + spatial)
+        out[:, :noise_dim].normal_(generator=self.generator)
+        index = labels.view((n, 1) + (1,) * len(spatial)).expand((n, 1) + spatial)
+        out[:, noise_dim:].zero_().scatter_(1, index, 1.)
+        return out
@@ -9,6 +9,7 @@ from utiles.imbalance_mnist import IMBALANCEMNIST
 from utiles.imbalance_cifar import IMBALANCECIFAR10
 import matplotlib.pyplot as plt
 from functools import reduce
+from gan.step_context import StepContext
 
 # Device configuration
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -183,15 +184,17 @@ d_optimizer = torch.optim.Adam(D.parameters(), lr=learning_rate_d, betas=(0.5, 0
 
 # Start training
 total_step = len(data_loader)
+# noise and label buffers allocated once on device, refilled in place every step
+step = StepContext(batch_size, device, noise_shape=(noise_dim, 1, 1))
 for epoch in range(epochs):
     for i, (images, _) in enumerate(data_loader):
         _batch = images.size(0)
         # images = images.reshape(_batch, -1).to(device)
         images = images.to(device)
 
-        real_labels = torch.ones(_batch, 1).to(device)
-        fake_labels = torch.zeros(_batch, 1).to(device)
-        z = torch.randn(_batch, noise_dim, 1, 1).to(device)  # mean==0, std==1
+        real_labels = step.real_labels(_batch)
+        fake_labels = step.fake_labels(_batch)
+        z = step.noise(_batch)  # mean==0, std==1
 
         # ================================================================== #
         #                      Train the discriminator                       #
@@ -15,6 +15,7 @@ import matplotlib.pyplot as plt
 from functools import reduce
 import numpy as np
 from utiles.sampler import SelectSampler
+from datasets.class_index import ClassIndex
 
 # Device configuration
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -229,12 +230,17 @@ ce_loss = nn.CrossEntropyLoss()
 adv_real_labels = torch.ones(batch_size, 1).to(device)
 cls_target_labels = torch.zeros(batch_size, dtype=torch.long).fill_(target_label).to(device)
 
-select_sampler_train = SelectSampler(data_source=dataset_train, target_label=target_label, shuffle=False)
+class_index_train = ClassIndex.of(dataset_train)
+class_index_test = ClassIndex.of(dataset_test)
+
+select_sampler_train = SelectSampler(data_source=dataset_train, target_label=target_label, shuffle=False,
+                                     class_index=class_index_train)
 loader_train = torch.utils.data.DataLoader(dataset=dataset_train,
                                           batch_size=batch_size,
                                           sampler=select_sampler_train)
 
-select_sampler_test = SelectSampler(data_source=dataset_test, target_label=target_label, shuffle=False)
+select_sampler_test = SelectSampler(data_source=dataset_test, target_label=target_label, shuffle=False,
+                                    class_index=class_index_test)
 loader_test = torch.utils.data.DataLoader(dataset=dataset_test,
                                           batch_size=batch_size,
                                           sampler=select_sampler_test)
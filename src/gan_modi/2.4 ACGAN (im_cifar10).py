@@ -10,6 +10,7 @@ from utiles.imbalance_cifar import IMBALANCECIFAR10
 import matplotlib.pyplot as plt
 from functools import reduce
 import numpy as np
+from gan.step_context import StepContext
 
 # Device configuration
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -210,10 +211,10 @@ ce_loss = nn.CrossEntropyLoss()
 g_optimizer = torch.optim.Adam(G.parameters(), lr=learning_rate_g, betas=(0.5, 0.999))
 d_optimizer = torch.optim.Adam(D.parameters(), lr=learning_rate_d, betas=(0.5, 0.999))
 
-onehot = torch.eye(num_class).to(device).view(10, 10, 1, 1)
-
 # Start training
 total_step = len(data_loader)
+# noise and label buffers allocated once on device, refilled in place every step
+step = StepContext(batch_size, device, noise_shape=(noise_dim, 1, 1), num_classes=10)
 for epoch in range(epochs):
     for i, (images, target) in enumerate(data_loader):
         _batch = images.size(0)
@@ -221,13 +222,11 @@ for epoch in range(epochs):
         images = images.to(device)
 
         real_target = target.to(device)
-        uni_target = (torch.rand(_batch) * 10).type_as(torch.LongTensor()).to(device)
-        onehot_target = onehot[uni_target]
+        uni_target = step.labels(_batch)
 
-        real_labels = torch.ones(_batch, 1).to(device)
-        fake_labels = torch.zeros(_batch, 1).to(device)
-        z = torch.randn(_batch, noise_dim, 1, 1).to(device)  # mean==0, std==1
-        z = torch.cat([z, onehot_target], dim=1)
+        real_labels = step.real_labels(_batch)
+        fake_labels = step.fake_labels(_batch)
+        z = step.conditioned_noise(uni_target)  # N(0, 1) noise followed by the one-hot of uni_target
 
         # ================================================================== #
         #                      Train the discriminator                       #
@@ -8,6 +8,7 @@ from torch.utils.tensorboard import SummaryWriter
 from utiles.imbalance_mnist import IMBALANCEMNIST
 import matplotlib.pyplot as plt
 from functools import reduce
+from gan.step_context import StepContext
 
 # Device configuration
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -189,6 +190,8 @@ onehot = torch.eye(num_class).to(device).view(10,10,1,1)
 
 # Start training
 total_step = len(data_loader)
+# noise and label buffers allocated once on device, refilled in place every step
+step = StepContext(batch_size, device, noise_shape=(noise_dim, 1, 1), num_classes=num_class)
 for epoch in range(epochs):
     for i, (images, target) in enumerate(data_loader):
         _batch = images.size(0)
@@ -201,12 +204,11 @@ for epoch in range(epochs):
         # uniform_target = (torch.rand(_batch)*10).type(torch.long)
         # uniform_onehot_target = onehot[uniform_target].repeat(1,1,32,32)
 
-        real_labels = torch.ones(_batch, 1).to(device)
-        fake_labels = torch.zeros(_batch, 1).to(device)
-        z = torch.randn(_batch, noise_dim, 1, 1).to(device)  # mean==0, std==1
+        real_labels = step.real_labels(_batch)
+        fake_labels = step.fake_labels(_batch)
 
         images = torch.cat([images, filled_onehot_target], dim=1)
-        z = torch.cat([z, onehot_target], dim=1)
+        z = step.conditioned_noise(target)  # N(0, 1) noise followed by the one-hot of target
 
         # ================================================================== #
         #                      Train the discriminator                       #
@@ -4,45 +4,19 @@ from lightning.data_module.imbalance_cifar import Imbalanced_CIFAR10
 from torch.utils.data import Sampler, DataLoader
 import numpy as np
 import random
-
-class BalancedSampler(Sampler):
-    def __init__(self, buckets, retain_epoch_size=False):
-        for bucket in buckets:
-            random.shuffle(bucket)
-
-        self.bucket_num = len(buckets)
-        self.buckets = buckets
-        self.bucket_pointers = [0 for _ in range(self.bucket_num)]
-        self.retain_epoch_size = retain_epoch_size
-
-    def __iter__(self):
-        count = self.__len__()
-        print('sampler', count)
-        while count > 0:
-            yield self._next_item()
-            count -= 1
-
-    def _next_item(self):
-        bucket_idx = random.randint(0, self.bucket_num - 1)
-        bucket = self.buckets[bucket_idx]
-        item = bucket[self.bucket_pointers[bucket_idx]]
-        self.bucket_pointers[bucket_idx] += 1
-        if self.bucket_pointers[bucket_idx] == len(bucket):
-            self.bucket_pointers[bucket_idx] = 0
-            random.shuffle(bucket)
-        return item
-
-    def __len__(self):
-        if self.retain_epoch_size:
-            return sum([len(bucket) for bucket in self.buckets])  # AcruQRally we need to upscale to next full batch
-        else:
-            return max([len(bucket) for bucket in
-                        self.buckets]) * self.bucket_num  # Ensures every instance has the chance to be visited in an epoch
-
+from datasets.sampler import BalancedSampler, StratifiedBatchSampler, PrioritySampler, WithIndices
+from datasets.class_index import ClassIndex
+from datasets.resumable import ResumableDataLoader
+from datasets.tensor_dataset import InMemoryImageDataset, batch_collate
+from datasets.cache import CachedImageDataset
+from datasets.synthetic import Synthetic_CIFAR10
+from datasets.batch_transforms import BatchCompose, BatchRandomCrop, BatchRandomHorizontalFlip, BatchRandomRotation
 
 
 class ImbalancedMNISTDataModule(pl.LightningDataModule):
-    def __init__(self, image_size, batch_size, imb_factor, balanced, retain_epoch_size, augmentation):
+    def __init__(self, image_size, batch_size, imb_factor, balanced, retain_epoch_size, augmentation,
+                 samples_per_class=None, in_memory=False, cache_dir=None, priority=None,
+                 synthetic=False):
         super().__init__()
         self.save_hyperparameters()
 
@@ -50,9 +24,21 @@ class ImbalancedMNISTDataModule(pl.LightningDataModule):
         self.batch_size = batch_size
         self.balanced = balanced
         self.retain_epoch_size = retain_epoch_size
-
-        normalize = transforms.Normalize(mean=[0.4914, 0.4822, 0.4465],
-                                         std=[0.2023, 0.1994, 0.2010])
+        self.samples_per_class = samples_per_class
+
+        # synthetic: deterministic fake images behind the same interface, no data files needed (datasets.synthetic)
+        dataset_cls = Synthetic_CIFAR10 if synthetic else Imbalanced_CIFAR10
+        if cache_dir is not None:
+            # transforms are set below, once the normalization is known
+            self.train_dataset = CachedImageDataset.load_or_build(dataset_cls, "~/data/", cache_dir, train=True,
+                                                                  imb_factor=imb_factor, image_size=image_size)
+            self.test_dataset = CachedImageDataset.load_or_build(dataset_cls, "~/data/", cache_dir, train=False)
+            # statistics of the imbalanced subset actually trained on, computed once and kept in the cache entry
+            stats = self.train_dataset.stats()
+            normalize = transforms.Normalize(mean=stats['mean'], std=stats['std'])
+        else:
+            normalize = transforms.Normalize(mean=[0.4914, 0.4822, 0.4465],
+                                             std=[0.2023, 0.1994, 0.2010])
         if augmentation:
             train_transform = transforms.Compose([
                 transforms.Resize(image_size),
@@ -78,8 +64,12 @@ class ImbalancedMNISTDataModule(pl.LightningDataModule):
         print("Test dataloader")
         print(test_transform)
 
-        self.train_dataset = Imbalanced_CIFAR10("~/data/", train=True, download=False, transform=train_transform, imb_factor=imb_factor)
-        self.test_dataset = Imbalanced_CIFAR10("~/data/", train=False, download=False, transform=test_transform)
+        if cache_dir is not None:
+            self.train_dataset.transform = train_transform
+            self.test_dataset.transform = test_transform
+        else:
+            self.train_dataset = dataset_cls("~/data/", train=True, download=False, transform=train_transform, imb_factor=imb_factor)
+            self.test_dataset = dataset_cls("~/data/", train=False, download=False, transform=test_transform)
 
         self.num_classes = len(np.unique(self.train_dataset.targets))
 
@@ -89,23 +79,74 @@ class ImbalancedMNISTDataModule(pl.LightningDataModule):
 
         print(self.train_cls_num_list)
 
+        self.loader_kwargs = {'num_workers': 4, 'persistent_workers': True}
+        if in_memory:
+            # whole uint8 dataset in one tensor, batches are gathered, augmented and normalized in the main process
+            batch_transform = None
+            if augmentation:
+                batch_transform = BatchCompose([
+                    BatchRandomCrop(image_size, padding=4),
+                    BatchRandomHorizontalFlip(),
+                    BatchRandomRotation(15)])
+            self.train_dataset = InMemoryImageDataset(self.train_dataset, mean=normalize.mean, std=normalize.std,
+                                                      image_size=image_size, transform=batch_transform)
+            self.test_dataset = InMemoryImageDataset(self.test_dataset, mean=normalize.mean, std=normalize.std)
+            self.loader_kwargs = {'num_workers': 0, 'collate_fn': batch_collate}
+
+        # class buckets are built once here, not on every train_dataloader call
+        self.class_index = ClassIndex.of(self.train_dataset)
+
+        # kept across train_dataloader calls, training batches are then (images, labels, indices) and the model
+        # feeds it with datamodule.priority_sampler.update(losses, indices)
+        self.priority_sampler = None
+        if priority is not None:
+            self.priority_sampler = PrioritySampler(self.train_dataset, per_class=priority == 'class',
+                                                    class_index=self.class_index)
+
+        self.train_loader = None
+        self.train_loader_state = None
 
-    def train_dataloader(self):
-        if self.balanced:
-            buckets = [[] for _ in range(self.num_classes)]
-            for idx, label in enumerate(self.train_dataset.targets):
-                buckets[label].append(idx)
-            sampler = BalancedSampler(buckets, self.retain_epoch_size)
 
-            return DataLoader(self.train_dataset, batch_size=self.batch_size, shuffle=False, sampler=sampler, num_workers=4, persistent_workers=True)
+    def train_dataloader(self):
+        # ResumableDataLoader so that state_dict can checkpoint the sampler and the position in the epoch,
+        # the Trainer fetches one batch ahead: the model marks trained batches with train_loader.consume()
+        if self.samples_per_class is not None:
+            batch_sampler = StratifiedBatchSampler(self.train_dataset, self.samples_per_class, self.retain_epoch_size,
+                                                   class_index=self.class_index)
+            loader = ResumableDataLoader(self.train_dataset, batch_sampler=batch_sampler, count_on_yield=False, **self.loader_kwargs)
+        elif self.priority_sampler is not None:
+            loader = ResumableDataLoader(WithIndices(self.train_dataset), batch_size=self.batch_size, shuffle=False, sampler=self.priority_sampler, count_on_yield=False, **self.loader_kwargs)
+        elif self.balanced:
+            sampler = BalancedSampler(self.train_dataset, self.retain_epoch_size, class_index=self.class_index)
+
+            loader = ResumableDataLoader(self.train_dataset, batch_size=self.batch_size, shuffle=False, sampler=sampler, count_on_yield=False, **self.loader_kwargs)
         else:
-            return DataLoader(self.train_dataset, batch_size=self.batch_size, shuffle=True, sampler = None, num_workers=4, persistent_workers=True)
+            loader = ResumableDataLoader(self.train_dataset, batch_size=self.batch_size, shuffle=True, sampler = None, count_on_yield=False, **self.loader_kwargs)
+
+        if self.train_loader_state is not None:
+            loader.load_state_dict(self.train_loader_state)
+            self.train_loader_state = None
+        self.train_loader = loader
+        return loader
+
+    def state_dict(self):
+        # saved into the Lightning checkpoint, restores the sampler and skips the consumed batches on resume
+        if self.train_loader is None:
+            return {}
+        return {'train_loader': self.train_loader.state_dict()}
+
+    def load_state_dict(self, state_dict):
+        # checkpoints are restored before train_dataloader is built, the state is applied there
+        self.train_loader_state = state_dict.get('train_loader')
+        if self.train_loader is not None and self.train_loader_state is not None:
+            self.train_loader.load_state_dict(self.train_loader_state)
+            self.train_loader_state = None
 
     def val_dataloader(self):
-        return DataLoader(self.test_dataset, batch_size=self.batch_size, shuffle=False, num_workers=4, persistent_workers=True)
+        return DataLoader(self.test_dataset, batch_size=self.batch_size, shuffle=False, **self.loader_kwargs)
 
     def test_dataloader(self):
-        return DataLoader(self.test_dataset, batch_size=self.batch_size, shuffle=False, num_workers=4, persistent_workers=True)
+        return DataLoader(self.test_dataset, batch_size=self.batch_size, shuffle=False, **self.loader_kwargs)
 
 
 
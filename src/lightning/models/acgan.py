@@ -1,4 +1,5 @@
 
+import time
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -7,6 +8,7 @@ from torchmetrics.functional import confusion_matrix
 from torch.optim import SGD, Adam
 from models.resnet import resnet18, resnet34
 from models.generator import Generator, linear, snlinear, deconv2d, sndeconv2d
+from models.batchnorm import convert_split_bn, split_batch_norm
 
 import pytorch_lightning as pl
 from torchsummaryX import summary
@@ -56,7 +58,10 @@ class ACGAN(pl.LightningModule):
 
         super(ACGAN, self).__init__()
         self.save_hyperparameters()
-        self.fixed_noise = torch.randn(10, latent_dim).cuda().repeat(10, 1)
+        # D and G are updated from one fake batch per iteration, see training_step
+        self.automatic_optimization = False
+        # follows the module's device, not saved in checkpoints
+        self.register_buffer("fixed_noise", torch.randn(10, latent_dim).repeat(10, 1), persistent=False)
 
         if sn:
             self.G = Generator(linear=snlinear,
@@ -73,6 +78,7 @@ class ACGAN(pl.LightningModule):
                       image_size=image_size,
                       image_channel=image_channel,
                       std_channel=std_channel,
+                      num_classes=num_classes,
                       latent_dim=latent_dim,
                       bn=bn)
 
@@ -83,6 +89,10 @@ class ACGAN(pl.LightningModule):
         elif model == 'resnet34':
             self.D = resnet34(num_classes=num_classes, sn=sn)
 
+        if self.hparams.get("concat_d", False):
+            # real and fake go through D as one batch, BN keeps per-half statistics
+            self.D = convert_split_bn(self.D)
+
         # if sn:
             # self.D.add_module("last", FcNAdvModuel(linear=snlinear, feature=512, num_classes=10))
             # self.D.fc = FcNAdvModuel(linear=snlinear, num_classes=num_classes)
@@ -95,56 +105,108 @@ class ACGAN(pl.LightningModule):
     def forward(self, x, y):
         return self.G(x, y)
 
-    def training_step(self, batch, batch_idx, optimizer_idx):
-        real_image, real_label = batch
-
-        # train discriminator
-        if optimizer_idx == 0:
-            noise = torch.randn(real_image.size(0), 128).cuda()
-            fake_label = (torch.rand(real_image.size(0)) * 10).long().cuda()
-
-            fake_image = self(noise, fake_label)
-            # self.logger.experiment.add_images(tag="images", img_tensor=fake_image.detach().cpu(),
-            #                                   global_step=self.current_epoch)
-
+    def sample_noise(self, batch_size):
+        noise = torch.randn(batch_size, self.hparams.latent_dim, device=self.device)
+        fake_label = torch.randint(self.hparams.num_classes, (batch_size,), device=self.device)
+        return noise, fake_label
+
+    def d_step(self, real_image, real_label, fake_image, fake_label, d_optimizer, backward, indices=None):
+        if self.hparams.get("concat_d", False):
+            with split_batch_norm(self.D, 2):
+                adv_logit, cls_logit = self.D(torch.cat([real_image, fake_image.detach()]))
+            real_adv_logit, fake_adv_logit = adv_logit.split(real_image.size(0))
+            real_cls_logit, fake_cls_logit = cls_logit.split(real_image.size(0))
+        else:
             real_adv_logit, real_cls_logit = self.D(real_image)
             fake_adv_logit, fake_cls_logit = self.D(fake_image.detach())
 
-            d_adv_loss = d_loss_function(real_adv_logit, fake_adv_logit)
-            d_real_cls_loss = cls_loss_function(real_cls_logit, real_label)
-            d_fake_cls_loss = cls_loss_function(fake_cls_logit, fake_label)
-            # d_loss = (self.la * d_adv_loss) + ((1 - self.la) * d_cls_loss)
-            d_loss = d_adv_loss + d_real_cls_loss + d_fake_cls_loss
-
-            return {"loss" : d_loss}
-            # return {"loss" : d_adv_loss}
-
-        # train generator
-        if optimizer_idx == 1:
-            noise = torch.randn(real_image.size(0), 128).cuda()
-            fake_label = (torch.rand(real_image.size(0)) * 10).long().cuda()
-
+        d_adv_loss = d_loss_function(real_adv_logit, fake_adv_logit)
+        d_real_cls_loss = cls_loss_function(real_cls_logit, real_label)
+        d_fake_cls_loss = cls_loss_function(fake_cls_logit, fake_label)
+        # d_loss = (self.la * d_adv_loss) + ((1 - self.la) * d_cls_loss)
+        d_loss = d_adv_loss + d_real_cls_loss + d_fake_cls_loss
+
+        d_optimizer.zero_grad(set_to_none=True)
+        backward(d_loss)
+        d_optimizer.step()
+
+        trainer = getattr(self, "_trainer", None)
+        priority_sampler = getattr(getattr(trainer, 'datamodule', None), 'priority_sampler', None)
+        if priority_sampler is not None:
+            # per-sample real classification loss drives the over-sampling of hard / tail samples
+            priority_sampler.update(F.cross_entropy(real_cls_logit.detach(), real_label, reduction='none'), indices)
+
+        return d_loss.detach()
+
+    def g_step(self, fake_image, fake_label, g_optimizer, backward):
+        # D weights are not updated here, skip computing their gradients
+        self.D.requires_grad_(False)
+        fake_adv_logit, fake_cls_logit = self.D(fake_image)
+        g_adv_loss = g_loss_function(fake_adv_logit)
+        g_cls_loss = cls_loss_function(fake_cls_logit, fake_label)
+        # g_loss = g_adv_loss + g_cls_loss
+        g_loss = (self.hparams.la * g_adv_loss) + ((1 - self.hparams.la) * g_cls_loss)
+
+        g_optimizer.zero_grad(set_to_none=True)
+        backward(g_loss)
+        g_optimizer.step()
+        self.D.requires_grad_(True)
+        return g_loss.detach()
+
+    def train_iteration(self, real_image, real_label, d_optimizer, g_optimizer, backward, shared_fake=True,
+                        indices=None):
+        # the fake batch is generated once and shared by the D step (detached) and the G step,
+        # shared_fake=False samples and generates a second batch for the G step (the former two-pass behaviour)
+        noise, fake_label = self.sample_noise(real_image.size(0))
+        fake_image = self(noise, fake_label)
+        d_loss = self.d_step(real_image, real_label, fake_image, fake_label, d_optimizer, backward, indices)
+
+        if not shared_fake:
+            noise, fake_label = self.sample_noise(real_image.size(0))
             fake_image = self(noise, fake_label)
-            # fake_logit = self.D(fake_image)
-
-            fake_adv_logit, fake_cls_logit = self.D(fake_image)
-            g_adv_loss = g_loss_function(fake_adv_logit)
-            g_cls_loss = cls_loss_function(fake_cls_logit, fake_label)
-            # g_loss = g_adv_loss + g_cls_loss
-            g_loss = (self.la * g_adv_loss) + ((1 - self.la) * g_cls_loss)
-
-            return {"loss": g_loss}
-            # return {"loss": g_adv_loss}
-
+        g_loss = self.g_step(fake_image, fake_label, g_optimizer, backward)
+        return {"d_loss": d_loss, "g_loss": g_loss}
+
+    def on_train_batch_start(self, batch, batch_idx, *args):
+        # the datamodule's ResumableDataLoader counts this batch as consumed only now, not when the Trainer
+        # prefetched it, so a mid-epoch checkpoint resumes right after the last trained batch
+        train_loader = getattr(getattr(self._trainer, 'datamodule', None), 'train_loader', None)
+        if hasattr(train_loader, 'consume'):
+            train_loader.consume()
+
+    def training_step(self, batch, batch_idx):
+        # (image, label) or, with the datamodule's priority sampler, (image, label, index)
+        real_image, real_label = batch[:2]
+        indices = batch[2] if len(batch) > 2 else None
+        d_optimizer, g_optimizer = self.optimizers()
+        return self.train_iteration(real_image, real_label, d_optimizer, g_optimizer, self.manual_backward,
+                                    indices=indices)
 
     def training_epoch_end(self, output):
         # for i, v in enumerate(output):
         #     print(i, v)
 
-        d_loss = torch.stack([x[0]['loss'] for x in output]).mean()
-        g_loss = torch.stack([x[1]['loss'] for x in output]).mean()
+        d_loss = torch.stack([x['d_loss'] for x in output]).mean()
+        g_loss = torch.stack([x['g_loss'] for x in output]).mean()
         self.log_dict({"loss/d": d_loss, "loss/g": g_loss}, logger=True)
 
+    def benchmark(self, real_image, real_label, steps=50, warmup=5, shared_fake=True):
+        """Steps/sec of train_iteration on a fixed batch, outside the Trainer (plain backward, own optimizers)."""
+        self.train()
+        d_optimizer, g_optimizer = self.configure_optimizers()
+        real_image, real_label = real_image.to(self.device), real_label.to(self.device)
+        for _ in range(warmup):
+            self.train_iteration(real_image, real_label, d_optimizer, g_optimizer, torch.Tensor.backward, shared_fake)
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+        start = time.perf_counter()
+        for _ in range(steps):
+            output = self.train_iteration(real_image, real_label, d_optimizer, g_optimizer, torch.Tensor.backward,
+                                          shared_fake)
+        output["d_loss"].item()
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+        return steps / (time.perf_counter() - start)
 
     def validation_step(self, batch, batch_idx):
         image, label = batch
@@ -224,6 +286,7 @@ class ACGAN(pl.LightningModule):
         parser.add_argument("--beta1", default=0.5, type=float)
         parser.add_argument("--beta2", default=0.9, type=float)
         parser.add_argument("--la", default=0.3, type=float)
+        parser.add_argument("--concat_d", default=False, type=bool)
 
         parser.add_argument('--weight_decay', type=float, default=1e-5)
         return parent_parser
@@ -243,6 +306,11 @@ def cli_main():
     parser.add_argument("--imb_factor", default=0.01, type=float)
     parser.add_argument("--balanced", default=True, type=bool)
     parser.add_argument("--retain_epoch_size", default=False, type=bool)
+    parser.add_argument("--samples_per_class", default=None, type=int)
+    parser.add_argument("--in_memory", default=False, type=bool)
+    parser.add_argument("--cache_dir", default=None, type=str)
+    parser.add_argument("--priority", default=None, type=str, choices=['sample', 'class'])
+    parser.add_argument("--synthetic", default=False, type=bool)
     parser.add_argument('--epoch', type=int, default=200)
 
 
@@ -276,8 +344,8 @@ def cli_main():
                          # callbacks=[EarlyStopping(monitor='val_loss')],
                          callbacks=[checkpoint_callback],
                          # strategy=DDPStrategy(find_unused_parameters=True),
-                         accelerator='gpu',
-                         gpus=1,
+                         accelerator='gpu' if torch.cuda.is_available() else 'cpu',
+                         devices=1,
                          logger=logger
                          )
     trainer.fit(model, datamodule=dm)
@@ -287,8 +355,33 @@ def cli_main():
     print(result)
 
 
+def benchmark_main():
+    from argparse import ArgumentParser
+
+    # python -m lightning.models.acgan --benchmark [--concat_d True]
+    parser = ArgumentParser()
+    parser.add_argument("--benchmark", default=False, action='store_true')
+    parser.add_argument("--batch_size", default=128, type=int)
+    parser.add_argument("--steps", default=20, type=int)
+    parser = ACGAN.add_model_specific_args(parser)
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model = ACGAN(**vars(args)).to(device)
+    real_image = torch.randn(args.batch_size, args.image_channel, args.image_size, args.image_size)
+    real_label = torch.randint(args.num_classes, (args.batch_size,))
+    for name, shared_fake in (("two G passes", False), ("shared fake batch", True)):
+        steps_per_sec = model.benchmark(real_image, real_label, steps=args.steps, shared_fake=shared_fake)
+        print('{}: {:.2f} steps/sec'.format(name, steps_per_sec))
+
+
 if __name__ == '__main__':
-    cli_main()
+    import sys
+
+    if '--benchmark' in sys.argv:
+        benchmark_main()
+    else:
+        cli_main()
 
 
 
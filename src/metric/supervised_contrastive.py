@@ -37,10 +37,31 @@ class TwoCropTransform:
 
 
 transforms = Compose([ ToTensor(), Normalize([0.5,0.5,0.5],[0.5,0.5,0.5])])
-train_dataset = CIFAR10("../../data", download=False, transform=TwoCropTransform(train_transform), train=True)
-test_dataset = CIFAR10("../../data", download=False, transform=transforms, train=False)
-train_loader = DataLoader(dataset=train_dataset, batch_size=64, shuffle=True, num_workers=4)
-test_dataset = DataLoader(dataset=test_dataset, batch_size=64, shuffle=False, num_workers=1)
+batch_augmentation = False
+if batch_augmentation:
+    # both views are augmented per batch (on the device if the batch is moved first), no per-image PIL work
+    from datasets.tensor_dataset import InMemoryImageDataset, in_memory_loader
+    from datasets.batch_transforms import BatchCompose, BatchRandomResizedCrop, BatchRandomHorizontalFlip, \
+        BatchRandomApply, BatchColorJitter, BatchRandomGrayscale, BatchTwoCrop
+
+    train_batch_transform = BatchCompose([
+        BatchRandomResizedCrop(size=32, scale=(0.2, 1.)),
+        BatchRandomHorizontalFlip(),
+        BatchRandomApply(BatchColorJitter(0.4, 0.4, 0.4, 0.1), p=0.8),
+        BatchRandomGrayscale(p=0.2),
+    ])
+    train_dataset = InMemoryImageDataset(CIFAR10("../../data", download=False, train=True),
+                                         mean=[0., 0., 0.], std=[1., 1., 1.],
+                                         transform=BatchTwoCrop(train_batch_transform))
+    test_dataset = InMemoryImageDataset(CIFAR10("../../data", download=False, train=False),
+                                        mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
+    train_loader = in_memory_loader(train_dataset, batch_size=64, shuffle=True)
+    test_dataset = in_memory_loader(test_dataset, batch_size=64, shuffle=False)
+else:
+    train_dataset = CIFAR10("../../data", download=False, transform=TwoCropTransform(train_transform), train=True)
+    test_dataset = CIFAR10("../../data", download=False, transform=transforms, train=False)
+    train_loader = DataLoader(dataset=train_dataset, batch_size=64, shuffle=True, num_workers=4)
+    test_dataset = DataLoader(dataset=test_dataset, batch_size=64, shuffle=False, num_workers=1)
 
 # iter = iter(train_loader).__next__()
 # cat = torch.cat( [iter[0][0], iter[0][1]] , dim=0)
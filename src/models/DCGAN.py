@@ -1,10 +1,14 @@
 import torch.nn as nn
 
+from models.normalize import InputNormalize, fold_normalize
+
 
 # Discriminator
 class Discriminator(nn.Module):
-    def __init__(self, nc, ndf):
+    def __init__(self, nc, ndf, normalize=None):
         super(Discriminator, self).__init__()
+        # normalize=(mean, std): real batches may come as uint8, generator outputs pass through unchanged
+        self.normalize = InputNormalize(*normalize) if normalize is not None else nn.Identity()
         self.main = nn.Sequential(
             # input is (nc) x 64 x 64
             # nn.Conv2d(nc, ndf, 4, 2, 1, bias=False),
@@ -26,8 +30,14 @@ class Discriminator(nn.Module):
             # nn.Sigmoid()
         )
 
+    def fold_normalize(self):
+        # inference only, see models.normalize.FoldedConv2d
+        self.main[0] = fold_normalize(self.normalize, self.main[0])
+        self.normalize = nn.Identity()
+        return self
+
     def forward(self, input):
-        return self.main(input)
+        return self.main(self.normalize(input))
 
 # Generator
 class Generator(nn.Module):
@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class SplitBatchNorm2d(nn.BatchNorm2d):
+    """
+    BatchNorm2d that normalizes num_splits equal chunks of the batch with their own statistics.
+    Running stats are the average over the chunks.
+
+    With num_splits=2 a D(cat([real, fake])) forward gets the same per-half statistics
+    as the two separate D(real), D(fake) forwards; larger values give ghost batch norm.
+    num_splits=1 is a plain BatchNorm2d, and so is a training batch that num_splits does not divide
+    (e.g. the last, smaller batch of an epoch): it is normalized as a whole.
+    """
+
+    def __init__(self, num_features, eps=1e-5, momentum=0.1, affine=True, track_running_stats=True, num_splits=1):
+        super(SplitBatchNorm2d, self).__init__(num_features, eps, momentum, affine, track_running_stats)
+        self.num_splits = num_splits
+
+    def forward(self, x):
+        N, C, H, W = x.size()
+        k = self.num_splits
+        if not self.training or k == 1 or N % k != 0:
+            return super(SplitBatchNorm2d, self).forward(x)
+
+        # (N, C, H, W) -> (N/k, k*C, H, W) so that every chunk becomes its own group of channels
+        x = x.view(k, N // k, C, H, W).transpose(0, 1).reshape(N // k, k * C, H, W)
+        running_mean = self.running_mean.repeat(k) if self.track_running_stats else None
+        running_var = self.running_var.repeat(k) if self.track_running_stats else None
+        weight = self.weight.repeat(k) if self.affine else None
+        bias = self.bias.repeat(k) if self.affine else None
+
+        if self.track_running_stats:
+            self.num_batches_tracked.add_(1)
+        momentum = self.momentum
+        if momentum is None:
+            momentum = 1.0 / float(self.num_batches_tracked)
+
+        out = F.batch_norm(x, running_mean, running_var, weight, bias, True, momentum, self.eps)
+
+        if self.track_running_stats:
+            self.running_mean.copy_(running_mean.view(k, C).mean(0))
+            self.running_var.copy_(running_var.view(k, C).mean(0))
+
+        return out.view(N // k, k, C, H, W).transpose(0, 1).reshape(N, C, H, W)
+
+
+def convert_split_bn(module):
+    """
+    Replaces every nn.BatchNorm2d in module by a SplitBatchNorm2d.
+    Parameters and buffers are shared, not copied, so optimizers built on module.parameters() stay valid.
+    """
+    output = module
+    if isinstance(module, nn.BatchNorm2d) and not isinstance(module, SplitBatchNorm2d):
+        output = SplitBatchNorm2d(module.num_features, module.eps, module.momentum,
+                                  module.affine, module.track_running_stats)
+        output.weight = module.weight
+        output.bias = module.bias
+        output.running_mean = module.running_mean
+        output.running_var = module.running_var
+        output.num_batches_tracked = module.num_batches_tracked
+        output.train(module.training)
+    for name, child in module.named_children():
+        output.add_module(name, convert_split_bn(child))
+    return output
+
+
+@contextmanager
+def split_batch_norm(module, num_splits):
+    """Temporarily normalizes every SplitBatchNorm2d of module per num_splits chunks of the batch."""
+    layers = [m for m in module.modules() if isinstance(m, SplitBatchNorm2d)]
+    for layer in layers:
+        layer.num_splits = num_splits
+    try:
+        yield module
+    finally:
+        for layer in layers:
+            layer.num_splits = 1
@@ -1,12 +1,13 @@
 import torch
 import torch.nn as nn
-from torch.nn.utils import spectral_norm
+from models.spectral_norm import spectral_norm
 
 def linear(in_features, out_features, bias=True):
     return nn.Linear(in_features=in_features, out_features=out_features, bias=bias)
 
-def snlinear(in_features, out_features, bias=True):
-    return spectral_norm(nn.Linear(in_features=in_features, out_features=out_features, bias=bias), eps=1e-6)
+def snlinear(in_features, out_features, bias=True, n_power_iterations=1, interval=1):
+    return spectral_norm(nn.Linear(in_features=in_features, out_features=out_features, bias=bias), eps=1e-6,
+                         n_power_iterations=n_power_iterations, interval=interval)
 
 def batchnorm_2d(in_features, eps=1e-4, momentum=0.1, affine=True):
     return nn.BatchNorm2d(in_features, eps=eps, momentum=momentum, affine=affine, track_running_stats=True)
@@ -27,7 +28,8 @@ def deconv2d(in_channels, out_channels, kernel_size, stride=2, padding=0, dilati
                               groups=groups,
                               bias=bias)
 
-def sndeconv2d(in_channels, out_channels, kernel_size, stride=2, padding=0, dilation=1, groups=1, bias=True):
+def sndeconv2d(in_channels, out_channels, kernel_size, stride=2, padding=0, dilation=1, groups=1, bias=True,
+               n_power_iterations=1, interval=1):
     return spectral_norm(nn.ConvTranspose2d(in_channels=in_channels,
                                             out_channels=out_channels,
                                             kernel_size=kernel_size,
@@ -36,7 +38,7 @@ def sndeconv2d(in_channels, out_channels, kernel_size, stride=2, padding=0, dila
                                             dilation=dilation,
                                             groups=groups,
                                             bias=bias),
-                         eps=1e-6)
+                         eps=1e-6, n_power_iterations=n_power_iterations, interval=interval)
 
 
 class Generator(nn.Module):
@@ -0,0 +1,80 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class InputNormalize(nn.Module):
+    """
+    transforms.Normalize(mean, std) of a uint8 [0, 255] batch, as the first op of a model.
+
+    Lets the loaders ship uint8 batches (4x fewer bytes than float32) and normalize on device.
+    Float inputs are taken as already normalized and passed through, so a discriminator can be fed
+    uint8 real batches and float generator outputs alike.
+    The buffers are not persistent, state dicts stay the same as without the module.
+    """
+
+    def __init__(self, mean, std):
+        super(InputNormalize, self).__init__()
+        mean = torch.as_tensor(mean, dtype=torch.float32).view(1, -1, 1, 1)
+        std = torch.as_tensor(std, dtype=torch.float32).view(1, -1, 1, 1)
+        # (x / 255 - mean) / std == x * scale + shift
+        self.register_buffer('scale', 1. / (255. * std), persistent=False)
+        self.register_buffer('shift', -mean / std, persistent=False)
+
+    def forward(self, x):
+        if x.dtype != torch.uint8:
+            return x
+        return torch.addcmul(self.shift, x.float(), self.scale)
+
+    def extra_repr(self):
+        mean = (-self.shift / (255. * self.scale)).flatten().tolist()
+        std = (1. / (255. * self.scale)).flatten().tolist()
+        return 'mean={}, std={}'.format([round(m, 4) for m in mean], [round(s, 4) for s in std])
+
+
+class FoldedConv2d(nn.Module):
+    """
+    conv(normalize(x)) for uint8 x with the normalize folded into the conv weight and bias.
+
+    conv is linear, so conv(x * scale + shift) == conv'(x) + conv(shift), with the scale folded into the
+    weight and conv(shift) a constant map. With zero padding that map is not constant near the border;
+    it is computed once per input size and cached, so the result matches the unfolded model up to float
+    rounding (the folded weight and bias reassociate the sums, about 1e-3 on CIFAR-sized uint8 input).
+    Folding is for inference only: float inputs go through the original conv, and the weights are copied
+    when folding, so fold after training / loading a checkpoint.
+    """
+
+    def __init__(self, normalize, conv):
+        super(FoldedConv2d, self).__init__()
+        assert conv.padding_mode == 'zeros', 'only zero padding can be folded'
+        self.conv = conv
+        with torch.no_grad():
+            weight = conv.weight.detach()
+            self.register_buffer('weight', weight * normalize.scale.view(1, -1, 1, 1).to(weight), persistent=False)
+            self.register_buffer('shift', normalize.shift.to(weight), persistent=False)
+        self._shift_maps = {}
+
+    def _shift_map(self, size, device, dtype):
+        key = (tuple(size), device, dtype)
+        if key not in self._shift_maps:
+            conv = self.conv
+            with torch.no_grad():
+                image = self.shift.to(device=device, dtype=dtype).expand(1, -1, *size)
+                self._shift_maps[key] = F.conv2d(image, conv.weight.detach().to(device=device, dtype=dtype),
+                                                 conv.bias, conv.stride, conv.padding, conv.dilation, conv.groups)
+        return self._shift_maps[key]
+
+    def forward(self, x):
+        if x.dtype != torch.uint8:
+            return self.conv(x)
+        conv = self.conv
+        out = F.conv2d(x.to(self.weight.dtype), self.weight, None, conv.stride, conv.padding, conv.dilation,
+                       conv.groups)
+        return out + self._shift_map(x.shape[-2:], out.device, out.dtype)
+
+
+def fold_normalize(normalize, conv):
+    """FoldedConv2d of an InputNormalize and the conv right after it, conv unchanged if normalize is not one."""
+    if not isinstance(normalize, InputNormalize):
+        return conv
+    return FoldedConv2d(normalize, conv)
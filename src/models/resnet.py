@@ -6,7 +6,9 @@ try:
 except ImportError:
     from torch.utils.model_zoo import load_url as load_state_dict_from_url
 
-from torch.nn.utils import spectral_norm
+from models.spectral_norm import spectral_norm
+
+from models.normalize import InputNormalize, fold_normalize
 
 __all__ = ['ResNet', 'resnet18', 'resnet34', 'resnet50', 'resnet101',
            'resnet152', 'resnext50_32x4d', 'resnext101_32x8d',
@@ -137,8 +139,10 @@ class ResNet(nn.Module):
 
     def __init__(self, block, layers, num_classes=1000, zero_init_residual=False,
                  groups=1, width_per_group=64, replace_stride_with_dilation=None,
-                 norm_layer=None, sn=False, discriminator=False, **kwargs):
+                 norm_layer=None, sn=False, discriminator=False, normalize=None, **kwargs):
         super(ResNet, self).__init__()
+        # normalize=(mean, std): takes uint8 batches and normalizes them on device
+        self.normalize = InputNormalize(*normalize) if normalize is not None else nn.Identity()
         if norm_layer is None:
             norm_layer = nn.BatchNorm2d
         self._norm_layer = norm_layer
@@ -227,8 +231,15 @@ class ResNet(nn.Module):
 
         return nn.Sequential(*layers)
 
+    def fold_normalize(self):
+        # inference only, see models.normalize.FoldedConv2d
+        self.conv1 = fold_normalize(self.normalize, self.conv1)
+        self.normalize = nn.Identity()
+        return self
+
     def _forward_impl(self, x):
         # See note [TorchScript super()]
+        x = self.normalize(x)
         x = self.conv1(x)
         x = self.bn1(x)
         x = self.relu(x)
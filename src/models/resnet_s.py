@@ -28,6 +28,8 @@ import torch.nn.functional as F
 import torch.nn.init as init
 from torch.nn import Parameter
 
+from models.normalize import InputNormalize, fold_normalize
+
 __all__ = ['ResNet_s', 'resnet20', 'resnet32', 'resnet44', 'resnet56', 'resnet110', 'resnet1202']
 
 def _weights_init(m):
@@ -94,10 +96,13 @@ class BasicBlock(nn.Module):
 
 class ResNet_s(nn.Module):
 
-    def __init__(self, block, num_blocks, num_classes=10, reduce_dimension=False, layer2_output_dim=None, layer3_output_dim=None, use_norm=False, s=30):
+    def __init__(self, block, num_blocks, num_classes=10, reduce_dimension=False, layer2_output_dim=None, layer3_output_dim=None, use_norm=False, s=30, normalize=None):
         super(ResNet_s, self).__init__()
         self.in_planes = 16
 
+        # normalize=(mean, std): takes uint8 batches and normalizes them on device
+        self.normalize = InputNormalize(*normalize) if normalize is not None else nn.Identity()
+
         self.conv1 = nn.Conv2d(3, 16, kernel_size=3, stride=1, padding=1, bias=False)
         self.bn1 = nn.BatchNorm2d(16)
         self.layer1 = self._make_layer(block, 16, num_blocks[0], stride=1)
@@ -148,7 +153,14 @@ class ResNet_s(nn.Module):
         if count > 0:
             print("Warning: detected at least one frozen BN, set them to eval state. Count:", count)
 
+    def fold_normalize(self):
+        # inference only, see models.normalize.FoldedConv2d
+        self.conv1 = fold_normalize(self.normalize, self.conv1)
+        self.normalize = nn.Identity()
+        return self
+
     def forward(self, x):
+        x = self.normalize(x)
         out = F.relu(self.bn1(self.conv1(x)), inplace=True)
         out = self.layer1(out)
         out = self.layer2(out)
@@ -167,8 +179,8 @@ def resnet20():
     return ResNet_s(BasicBlock, [3, 3, 3])
 
 
-def resnet32(num_classes=10, use_norm=False):
-    return ResNet_s(BasicBlock, [5, 5, 5], num_classes=num_classes, use_norm=use_norm)
+def resnet32(num_classes=10, use_norm=False, normalize=None):
+    return ResNet_s(BasicBlock, [5, 5, 5], num_classes=num_classes, use_norm=use_norm, normalize=normalize)
 
 
 def resnet44():
@@ -2,8 +2,12 @@ from torch.utils.data import Dataset, DataLoader
 import torchvision
 from torchvision import transforms
 from .data import getSubDataset
+from datasets.integrity import VerifiedCIFAR10
+from datasets.shards import write_shards
+from datasets.decode import BatchDecoder, open_image
 import numpy as np
 import os
+import random
 from PIL import Image
 
 
@@ -26,10 +30,10 @@ class CIFAR10:
                                              std=(0.5, 0.5, 0.5))])
 
         # Dataset define
-        self.train_dataset = torchvision.datasets.CIFAR10(root='../../data/',
+        self.train_dataset = VerifiedCIFAR10(root='../../data/',
                                            train=True,
                                            download=True)
-        self.test_dataset = torchvision.datasets.CIFAR10(root='../../data/',
+        self.test_dataset = VerifiedCIFAR10(root='../../data/',
                                            train=False,
                                            download=True)
 
@@ -130,10 +134,15 @@ class MNIST:
 
 
 class ImageNetLT(Dataset):
-    def __init__(self, type='train', transform=None):
+    """
+    ImageNet-LT split read from the raw JPEGs.
+    decode_size decodes every JPEG at the smallest DCT scale still >= decode_size (set it to the first Resize),
+    decode_threads > 1 lets __getitems__ decode and transform a whole batch on a thread pool.
+    """
+
+    def __init__(self, type='train', transform=None, decode_size=None, decode_threads=0):
         BASEPATH = '../../data/ImageNet_LT'
         self.img_path = os.path.join(BASEPATH, 'ImageNet_LT_open')
-        print(os.listdir(self.img_path))
         if type == 'train': data_path = os.path.join(BASEPATH, 'ImageNet_LT_train.txt')
         elif type == 'val': data_path = os.path.join(BASEPATH, 'ImageNet_LT_val.txt')
         elif type == 'test': data_path = os.path.join(BASEPATH, 'ImageNet_LT_test.txt')
@@ -152,8 +161,9 @@ class ImageNetLT(Dataset):
             # data_file = list(map(lambda x: [x[0].split('_')[1], x[1]], data_file))
 
         self.class_list = [i[1] for i in self.data_file]
-        self.classes = list(set(self.class_list))
-        self.class_count = {classes:self.class_list.count(classes) for classes in self.classes}
+        counts = np.bincount(np.asarray(self.class_list, dtype=np.int64))
+        self.classes = np.flatnonzero(counts).tolist()
+        self.class_count = dict(zip(self.classes, counts[self.classes].tolist()))
 
         # print(self.img_path)
         # print(self.data_file[100])
@@ -162,6 +172,8 @@ class ImageNetLT(Dataset):
         # print(self.class_count)
 
         self.transform = transform
+        self.decode_size = decode_size
+        self.decoder = BatchDecoder(decode_threads, decode_size)
 
     def __len__(self):
         return len(self.data_file)
@@ -169,17 +181,34 @@ class ImageNetLT(Dataset):
     def __getitem__(self, index):
         img, label = self.data_file[index]
         img = os.path.join(self.img_path, img)
-        print(img)
-        img = Image.open(img)
+        img = open_image(img, self.decode_size)
 
         if self.transform is not None:
             img = self.transform(img)
 
         return img, label
 
+    def __getitems__(self, indices):
+        paths = [os.path.join(self.img_path, self.data_file[index][0]) for index in indices]
+        imgs = self.decoder(paths, self.transform)
+        return [(img, self.data_file[index][1]) for img, index in zip(imgs, indices)]
+
+    def samples(self):
+        return [(os.path.join(self.img_path, img), label) for img, label in self.data_file]
+
+    def write_shards(self, out_dir, prefix, shard_size=5000, seed=0):
+        """Packs this split into tar shards for datasets.shards.ShardedImageDataset, samples shuffled once."""
+        samples = self.samples()
+        random.Random(seed).shuffle(samples)
+        return write_shards(samples, out_dir, prefix, shard_size)
+
 
 
 
+if __name__ == '__main__':
+    # python -m utiles.dataset: pack ImageNet-LT into shards next to the raw images
+    for split in ['train', 'val', 'test']:
+        print(ImageNetLT(type=split).write_shards('../../data/ImageNet_LT/shards', split))
 
 # if __name__ == '__main__':
 #     imageNet_LT = ImageNetLT()
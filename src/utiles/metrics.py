@@ -0,0 +1,63 @@
+import torch
+
+
+class MetricAccumulator:
+    """
+    Running sums and EMAs of scalar training metrics kept as device tensors.
+
+    update / update_sum / ema only queue tensor ops on the device of the value (no .item(), no host
+    sync); flush() copies everything to the host in one transfer at log intervals, returns
+    {name: mean since the last flush} plus the current EMAs and resets the sums (the EMAs carry on).
+    Counts are Python numbers, batch sizes are known on the host.
+    """
+
+    def __init__(self):
+        self.sums = {}
+        self.counts = {}
+        self.emas = {}
+
+    def _sum(self, name, value):
+        if name not in self.sums:
+            self.sums[name] = torch.zeros((), dtype=torch.float32, device=value.device)
+            self.counts[name] = 0
+        return self.sums[name]
+
+    def update(self, name, value, n=1):
+        # value: mean over n items (e.g. a batch loss)
+        value = torch.as_tensor(value).detach()
+        self._sum(name, value).add_(value.float(), alpha=n)
+        self.counts[name] += n
+
+    def update_sum(self, name, total, n):
+        # total: sum over n items (e.g. (pred == target).sum() for accuracy)
+        total = torch.as_tensor(total).detach()
+        self._sum(name, total).add_(total.float())
+        self.counts[name] += n
+
+    def ema(self, name, value, decay=0.9, init=None):
+        """EMA of value on device, starts from value (or init) and is returned as a tensor."""
+        value = torch.as_tensor(value).detach().float()
+        if name not in self.emas:
+            start = value if init is None else torch.full_like(value, init)
+            self.emas[name] = start.clone()
+            if init is None:
+                return self.emas[name]
+        return self.emas[name].lerp_(value, 1 - decay)
+
+    def flush(self):
+        names = list(self.sums)
+        ema_names = list(self.emas)
+        values = [self.sums[name] for name in names] + [self.emas[name] for name in ema_names]
+        if not values:
+            return {}
+        # one copy to the host for everything
+        host = torch.stack([v.to(values[0].device) for v in values]).tolist()
+        result = {name: value / max(self.counts[name], 1) for name, value in zip(names, host)}
+        result.update({name: value for name, value in zip(ema_names, host[len(names):])})
+        self.reset()
+        return result
+
+    def reset(self):
+        # drops the sums without reading them (no sync), the EMAs carry on
+        self.sums = {}
+        self.counts = {}
@@ -1,30 +1,58 @@
 import torch
-from torch.utils.data import Subset, ConcatDataset
+import numpy as np
+from torch.utils.data import Dataset
 import matplotlib.pyplot as plt
 import seaborn as sns
 
 
+class IndexedSubset(Dataset):
+    """
+    Flat view of dataset through one int64 index array, replaces the nested Subset / ConcatDataset stack.
+    Views of views are collapsed into a single index array, __getitems__ fetches a whole batch in one call.
+    src_cls is run on its own (without src/ on the path), this mirrors src/utiles/data.py's IndexedSubset.
+    """
+
+    def __init__(self, dataset, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        if isinstance(dataset, IndexedSubset):
+            dataset, indices = dataset.dataset, dataset.indices[indices]
+        self.dataset = dataset
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        return self.dataset[int(self.indices[index])]
+
+    def __getitems__(self, indices):
+        indices = self.indices[np.asarray(indices, dtype=np.int64)].tolist()
+        if hasattr(self.dataset, '__getitems__'):
+            return self.dataset.__getitems__(indices)
+        return [self.dataset[i] for i in indices]
+
+
 def sliceDataset(dataset, class_index:dict, labels:torch.tensor, lratio:list):
-    transformed_dataset = []
     count_dataset = {'class':[], 'original': [], 'transformed': []}
 
+    labels = torch.as_tensor(labels).numpy()
+    # one stable sort groups every class, its indices stay in ascending order
+    order = np.argsort(labels, kind='stable')
+    sorted_labels = labels[order]
+
+    selected = []
     for i, (name, idx) in enumerate(class_index.items()):
-        target_label_indeces = torch.where(labels == idx)[0].numpy()
-        # print(i, target_label_indeces)
-        target_subset = Subset(dataset, target_label_indeces)
-        len_dataset = len(target_subset)
+        start, end = np.searchsorted(sorted_labels, idx, 'left'), np.searchsorted(sorted_labels, idx, 'right')
+        len_dataset = int(end - start)
 
         ratio = len_dataset * (1 * lratio[i])
         ratio = int(ratio)
-        transformed_subset = Subset(target_subset, range(ratio))
-        len_transformed = len(transformed_subset)
-        # print(len(transformed_subset))
+        len_transformed = min(ratio, len_dataset)
+        selected.append(order[start:start + len_transformed])
 
         count_dataset['class'] += [name]
         count_dataset['original'] += [len_dataset]
         count_dataset['transformed'] +=[len_transformed]
 
-        transformed_dataset += [transformed_subset]
-
-    transformed_dataset = ConcatDataset(transformed_dataset)
-    return transformed_dataset, count_dataset
\ No newline at end of file
+    transformed_dataset = IndexedSubset(dataset, np.concatenate(selected) if selected else [])
+    return transformed_dataset, count_dataset
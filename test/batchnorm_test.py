@@ -0,0 +1,67 @@
+import torch
+import torch.nn as nn
+
+from models.batchnorm import SplitBatchNorm2d, convert_split_bn, split_batch_norm
+
+
+def _halves_reference(x, momentum=0.1):
+    # two plain BatchNorm2d, one per half, from the same initial state
+    bn_a, bn_b = nn.BatchNorm2d(x.size(1), momentum=momentum), nn.BatchNorm2d(x.size(1), momentum=momentum)
+    a, b = x.chunk(2)
+    return torch.cat([bn_a(a), bn_b(b)]), bn_a, bn_b
+
+
+def test_split_forward_matches_separate_halves():
+    torch.manual_seed(0)
+    x = torch.cat([torch.randn(8, 3, 4, 4), torch.randn(8, 3, 4, 4) * 3 + 2])
+    bn = SplitBatchNorm2d(3, num_splits=2)
+
+    expected, _, _ = _halves_reference(x)
+    assert torch.allclose(bn(x), expected, atol=1e-5)
+
+
+def test_split_running_stats_are_the_average_over_chunks():
+    torch.manual_seed(0)
+    x = torch.cat([torch.randn(8, 3, 4, 4), torch.randn(8, 3, 4, 4) * 3 + 2])
+    bn = SplitBatchNorm2d(3, num_splits=2)
+    bn(x)
+
+    _, bn_a, bn_b = _halves_reference(x)
+    assert torch.allclose(bn.running_mean, (bn_a.running_mean + bn_b.running_mean) / 2, atol=1e-6)
+    assert torch.allclose(bn.running_var, (bn_a.running_var + bn_b.running_var) / 2, atol=1e-6)
+    assert bn.num_batches_tracked.item() == 1
+
+
+def test_indivisible_batch_falls_back_to_plain_batch_norm():
+    torch.manual_seed(0)
+    x = torch.randn(5, 3, 4, 4)
+    bn, plain = SplitBatchNorm2d(3, num_splits=2), nn.BatchNorm2d(3)
+
+    assert torch.allclose(bn(x), plain(x), atol=1e-6)
+    assert torch.allclose(bn.running_mean, plain.running_mean)
+    assert torch.allclose(bn.running_var, plain.running_var)
+
+
+def test_eval_uses_running_stats():
+    torch.manual_seed(0)
+    bn = SplitBatchNorm2d(3, num_splits=2)
+    bn(torch.randn(8, 3, 4, 4) + 1)
+    plain = nn.BatchNorm2d(3)
+    plain.load_state_dict(bn.state_dict())
+    bn.eval()
+    plain.eval()
+
+    x = torch.randn(4, 3, 4, 4)
+    assert torch.equal(bn(x), plain(x))
+
+
+def test_convert_shares_parameters_and_restores_num_splits():
+    model = nn.Sequential(nn.Conv2d(3, 3, 1), nn.BatchNorm2d(3))
+    weight, running_mean = model[1].weight, model[1].running_mean
+    model = convert_split_bn(model)
+
+    assert isinstance(model[1], SplitBatchNorm2d)
+    assert model[1].weight is weight and model[1].running_mean is running_mean
+    with split_batch_norm(model, 2):
+        assert model[1].num_splits == 2
+    assert model[1].num_splits == 1
@@ -0,0 +1,49 @@
+import numpy as np
+
+from datasets.class_index import ClassIndex
+
+
+TARGETS = np.array([3, 1, 3, 0, 1, 3, 5, 0])
+
+
+class _Dataset:
+    targets = TARGETS
+
+
+def test_from_targets_groups_indices_by_class():
+    index = ClassIndex.from_targets(TARGETS)
+    assert index.classes.tolist() == [0, 1, 3, 5]
+    assert index.counts.tolist() == [2, 2, 3, 1]
+    assert [bucket.tolist() for bucket in index.buckets()] == [[3, 7], [1, 4], [0, 2, 5], [6]]
+
+
+def test_getitem_matches_where_and_is_empty_for_absent_classes():
+    index = ClassIndex.from_targets(TARGETS)
+    for label in range(7):
+        assert index[label].tolist() == np.where(TARGETS == label)[0].tolist()
+
+
+def test_select_keeps_the_order_of_the_given_labels():
+    index = ClassIndex.from_targets(TARGETS)
+    assert index.select(3).tolist() == [0, 2, 5]
+    assert index.select([5, 0, 3]).tolist() == [6, 3, 7, 0, 2, 5]
+    assert index.select([2, 4]).tolist() == []
+    assert index.select([]).tolist() == []
+    assert index.select(np.array([1])).dtype == np.int64
+
+
+def test_of_caches_the_index_on_the_dataset():
+    dataset = _Dataset()
+    index = ClassIndex.of(dataset)
+    assert dataset.class_index is index
+    assert ClassIndex.of(dataset) is index
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = ClassIndex.from_targets(TARGETS)
+    index.save(str(tmp_path))
+    loaded = ClassIndex.load(str(tmp_path))
+    assert np.array_equal(loaded.classes, index.classes)
+    assert np.array_equal(loaded.offsets, index.offsets)
+    assert np.array_equal(loaded.indices, index.indices)
+    assert [path.name for path in tmp_path.iterdir()] == [ClassIndex.FILENAME]
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from datasets.imbalance import imbalanced_counts, imbalanced_indices
+
+
+def _loop_counts(img_max, cls_num, imb_type, imb_factor, reverse):
+    # the former get_img_num_per_cls of the Imbalanced_* datasets
+    img_num_per_cls = []
+    if imb_type == 'exp':
+        for cls_idx in range(cls_num):
+            if reverse:
+                num = img_max * (imb_factor ** (((cls_num - 1) - cls_idx) / (cls_num - 1.0)))
+                img_num_per_cls.append(int(num))
+            else:
+                num = img_max * (imb_factor ** (cls_idx / (cls_num - 1.0)))
+                img_num_per_cls.append(int(num))
+    elif imb_type == 'step':
+        for cls_idx in range(cls_num // 2):
+            img_num_per_cls.append(int(img_max))
+        for cls_idx in range(cls_num // 2):
+            img_num_per_cls.append(int(img_max * imb_factor))
+    else:
+        img_num_per_cls.extend([int(img_max)] * cls_num)
+    return img_num_per_cls
+
+
+def _loop_indices(targets, img_num_per_cls):
+    # the former gen_imbalanced_data, returning the selected indices instead of the data
+    targets_np = np.array(targets, dtype=np.int64)
+    classes = np.unique(targets_np)
+    selected, num_per_cls_dict = [], dict()
+    for the_class, the_img_num in zip(classes, img_num_per_cls):
+        num_per_cls_dict[the_class] = the_img_num
+        idx = np.where(targets_np == the_class)[0]
+        np.random.shuffle(idx)
+        selected.append(idx[:the_img_num])
+    return np.concatenate(selected), num_per_cls_dict
+
+
+@pytest.mark.parametrize('img_max, cls_num', [(5000, 10), (500, 100), (6000, 10), (1300, 1000)])
+@pytest.mark.parametrize('imb_type', ['exp', 'step', 'none'])
+@pytest.mark.parametrize('imb_factor', [0.01, 0.02, 0.1, 0.5, 1])
+@pytest.mark.parametrize('reverse', [False, True])
+def test_counts_match_the_per_class_loop(img_max, cls_num, imb_type, imb_factor, reverse):
+    assert imbalanced_counts(img_max, cls_num, imb_type, imb_factor, reverse) == \
+        _loop_counts(img_max, cls_num, imb_type, imb_factor, reverse)
+
+
+def test_counts_accept_explicit_per_class_counts():
+    assert imbalanced_counts(100, 3, [5, 3, 1]) == [5, 3, 1]
+    with pytest.raises(AssertionError):
+        imbalanced_counts(100, 3, [5, 3])
+
+
+@pytest.mark.parametrize('seed', [0, 1, 7])
+def test_indices_select_the_same_samples_as_the_per_class_loop(seed):
+    targets = np.random.RandomState(123).randint(0, 10, 3000)
+    counts = imbalanced_counts(300, 10, 'exp', 0.05)
+
+    np.random.seed(seed)
+    expected, expected_dict = _loop_indices(targets, counts)
+    np.random.seed(seed)
+    selected, num_per_cls_dict = imbalanced_indices(targets, counts)
+
+    assert np.array_equal(selected, expected)
+    assert num_per_cls_dict == expected_dict
+    # the random state is left where the loop leaves it
+    after = np.random.random()
+    np.random.seed(seed)
+    _loop_indices(targets, counts)
+    assert np.random.random() == after
+
+
+def test_indices_without_shuffle_take_the_first_samples_of_every_class():
+    targets = np.array([1, 0, 1, 0, 1, 2, 0])
+    selected, num_per_cls_dict = imbalanced_indices(targets, [2, 1, 1], shuffle=False)
+    assert selected.tolist() == [1, 3, 0, 5]
+    assert num_per_cls_dict == {0: 2, 1: 1, 2: 1}
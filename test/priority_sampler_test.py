@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from datasets.sampler import SumTree, PrioritySampler, WithIndices
+
+
+class _Targets:
+    def __init__(self, targets):
+        self.targets = np.asarray(targets)
+
+    def __len__(self):
+        return len(self.targets)
+
+
+def test_sum_tree_total_and_update():
+    priorities = np.random.RandomState(0).rand(13)
+    tree = SumTree(priorities)
+    assert np.isclose(tree.total, priorities.sum())
+
+    priorities[[2, 2, 7]] = [5., 5., 0.]
+    tree.update([2, 7], [5., 0.])
+    assert np.allclose(tree.priorities, priorities)
+    assert np.isclose(tree.total, priorities.sum())
+
+
+def test_sum_tree_samples_proportionally_to_priority():
+    priorities = np.array([1., 0., 2., 4., 0., 1.])
+    tree = SumTree(priorities)
+    drawn = tree.sample(np.random.default_rng(0), 80000)
+
+    frequencies = np.bincount(drawn, minlength=len(priorities)) / len(drawn)
+    assert frequencies[[1, 4]].sum() == 0
+    assert np.allclose(frequencies, priorities / priorities.sum(), atol=0.01)
+
+
+def test_sum_tree_single_leaf():
+    tree = SumTree([3.])
+    assert tree.sample(np.random.default_rng(0), 5).tolist() == [0] * 5
+
+
+def test_update_needs_matching_indices():
+    sampler = PrioritySampler(_Targets([0, 1] * 8), seed=0)
+    with pytest.raises(ValueError):
+        sampler.update(torch.ones(4), None)
+    with pytest.raises(ValueError):
+        sampler.update(torch.ones(4), torch.arange(3))
+
+
+def test_update_moves_samples_towards_high_losses():
+    sampler = PrioritySampler(_Targets([0, 1] * 50), momentum=0., seed=0)
+    losses = torch.zeros(100)
+    losses[:10] = 10.
+    sampler.update(losses, torch.arange(100))
+
+    drawn = np.array(list(sampler))
+    assert len(drawn) == 100
+    assert (drawn < 10).mean() > 0.9
+
+
+def test_update_keeps_the_last_loss_of_a_repeated_index():
+    sampler = PrioritySampler(_Targets([0, 1] * 4), momentum=0.5, seed=0)
+    sampler.update(torch.tensor([4., 2.]), torch.tensor([3, 3]))
+    assert sampler.ema[3] == 0.5 * 1 + 0.5 * 2.
+    assert np.isclose(sampler.tree.priorities[3], sampler.ema[3] + sampler.eps)
+
+
+def test_per_class_draws_uniformly_inside_the_drawn_classes():
+    targets = np.array([0] * 30 + [1] * 30 + [2] * 40)
+    sampler = PrioritySampler(_Targets(targets), per_class=True, momentum=0., num_samples=3000, seed=0)
+    # class 1 gets all the priority, with the mean loss of its samples
+    sampler.update(torch.tensor([0., 8., 10., 0.]), torch.tensor([0, 30, 31, 60]))
+    assert sampler.ema.tolist() == [0., 9., 0.]
+
+    drawn = np.array(list(sampler))
+    assert (targets[drawn] == 1).mean() > 0.99
+    assert len(np.unique(drawn[targets[drawn] == 1])) == 30
+
+
+def test_epochs_are_reproducible_from_the_state():
+    sampler = PrioritySampler(_Targets([0, 1, 2] * 20), seed=3)
+    sampler.update(torch.arange(60.), torch.arange(60))
+    state = sampler.state_dict()
+    first = list(sampler)
+
+    restored = PrioritySampler(_Targets([0, 1, 2] * 20), seed=0)
+    restored.load_state_dict(state)
+    assert list(restored) == first
+    assert list(sampler) != first
+
+
+def test_with_indices_appends_the_dataset_index():
+    dataset = WithIndices(TensorDataset(torch.arange(10.), torch.arange(10) % 2))
+    assert dataset[4] == (dataset.dataset[4][0], dataset.dataset[4][1], 4)
+
+    sampler = PrioritySampler(_Targets(np.arange(10) % 2), seed=0)
+    for x, y, index in DataLoader(dataset, batch_size=4, sampler=sampler):
+        assert torch.equal(x, index.float())
+        sampler.update(x, index)
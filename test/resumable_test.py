@@ -0,0 +1,94 @@
+import numpy as np
+import torch
+from torch.utils.data import TensorDataset
+
+from datasets.class_index import ClassIndex
+from datasets.resumable import ResumableDataLoader
+from datasets.sampler import BalancedSampler, StratifiedBatchSampler
+
+
+TARGETS = np.array([0] * 20 + [1] * 12 + [2] * 8)
+DATASET = TensorDataset(torch.arange(len(TARGETS)), torch.from_numpy(TARGETS))
+
+
+def _balanced_loader(seed=0, **kwargs):
+    sampler = BalancedSampler(DATASET, seed=seed, class_index=ClassIndex.from_targets(TARGETS))
+    return ResumableDataLoader(DATASET, batch_size=5, sampler=sampler, **kwargs)
+
+
+def _stratified_loader(seed=0):
+    batch_sampler = StratifiedBatchSampler(DATASET, 2, seed=seed, class_index=ClassIndex.from_targets(TARGETS))
+    return ResumableDataLoader(DATASET, batch_sampler=batch_sampler)
+
+
+def _epoch(loader, batches=None):
+    out = []
+    for x, _ in loader:
+        out.append(x.tolist())
+        if batches is not None and len(out) == batches:
+            break
+    return out
+
+
+def _epoch_after(loader, epochs):
+    for _ in range(epochs):
+        _epoch(loader)
+    return _epoch(loader)
+
+
+def test_mid_epoch_resume_continues_after_the_last_batch():
+    for make in (_balanced_loader, _stratified_loader):
+        full = _epoch(make())
+        next_epoch = _epoch_after(make(), 1)
+
+        loader = make()
+        head = _epoch(loader, 3)
+        state = loader.state_dict()
+        assert state['batches'] == 3
+
+        resumed = make(seed=1)
+        resumed.load_state_dict(state)
+        assert head + _epoch(resumed) == full
+        # the epoch after the resumed one is the regular next epoch
+        assert _epoch(resumed) == next_epoch
+
+
+def test_resume_twice_in_the_same_epoch():
+    full = _epoch(_balanced_loader())
+
+    loader = _balanced_loader()
+    batches = _epoch(loader, 2)
+    loader_b = _balanced_loader(seed=5)
+    loader_b.load_state_dict(loader.state_dict())
+    batches += _epoch(loader_b, 3)
+    loader_c = _balanced_loader(seed=7)
+    loader_c.load_state_dict(loader_b.state_dict())
+    assert loader_c.batches == 5
+    assert batches + _epoch(loader_c) == full
+
+
+def test_state_between_epochs_starts_the_next_epoch():
+    loader = _balanced_loader()
+    _epoch(loader)
+    state = loader.state_dict()
+    assert state['batches'] == 0
+
+    resumed = _balanced_loader(seed=1)
+    resumed.load_state_dict(state)
+    assert _epoch(resumed) == _epoch(loader)
+
+
+def test_consume_counts_trained_batches_only():
+    full = _epoch(_balanced_loader())
+
+    loader = _balanced_loader(count_on_yield=False)
+    iterator = iter(loader)
+    head = [next(iterator)[0].tolist() for _ in range(4)]
+    # two fetched ahead, not trained on yet
+    loader.consume(2)
+    state = loader.state_dict()
+    assert state['batches'] == 2
+
+    resumed = _balanced_loader(seed=1, count_on_yield=False)
+    resumed.load_state_dict(state)
+    assert head[:2] + _epoch(resumed) == full
@@ -0,0 +1,100 @@
+import torch
+import torch.nn as nn
+from torch.nn.utils import spectral_norm as torch_spectral_norm
+
+from models.spectral_norm import StepSpectralNorm, spectral_norm, freeze_spectral_norm
+
+
+def _count_power_iterations(monkeypatch):
+    calls = []
+    power_iteration = StepSpectralNorm.power_iteration
+
+    def counted(self, module):
+        calls.append(module)
+        power_iteration(self, module)
+
+    monkeypatch.setattr(StepSpectralNorm, 'power_iteration', counted)
+    return calls
+
+
+def _train_step(layer, optimizer, forwards):
+    optimizer.zero_grad()
+    loss = sum(layer(torch.randn(4, 6)).pow(2).mean() for _ in range(forwards))
+    loss.backward()
+    optimizer.step()
+
+
+def test_one_power_iteration_per_optimizer_step(monkeypatch):
+    calls = _count_power_iterations(monkeypatch)
+    torch.manual_seed(0)
+    layer = spectral_norm(nn.Linear(6, 5))
+    optimizer = torch.optim.SGD(layer.parameters(), lr=0.1)
+
+    for step in range(3):
+        # D(real), D(fake), G step: several forwards between two updates
+        _train_step(layer, optimizer, 3)
+        assert len(calls) == step + 1
+
+
+def test_interval_skips_steps(monkeypatch):
+    calls = _count_power_iterations(monkeypatch)
+    torch.manual_seed(0)
+    layer = spectral_norm(nn.Linear(6, 5), interval=2)
+    optimizer = torch.optim.SGD(layer.parameters(), lr=0.1)
+
+    for _ in range(4):
+        _train_step(layer, optimizer, 2)
+    assert len(calls) == 2
+
+
+def test_no_power_iteration_outside_training(monkeypatch):
+    calls = _count_power_iterations(monkeypatch)
+    layer = spectral_norm(nn.Linear(6, 5)).eval()
+    with torch.no_grad():
+        first = layer(torch.randn(4, 6))
+        layer(torch.randn(4, 6))
+    assert calls == []
+    assert first.shape == (4, 5)
+
+
+def test_first_forward_matches_torch_spectral_norm():
+    torch.manual_seed(0)
+    reference = torch_spectral_norm(nn.Linear(6, 5))
+    torch.manual_seed(0)
+    layer = spectral_norm(nn.Linear(6, 5))
+
+    x = torch.randn(4, 6)
+    assert torch.allclose(layer(x), reference(x), atol=1e-6)
+    assert layer.state_dict().keys() == reference.state_dict().keys()
+    for key, value in reference.state_dict().items():
+        assert torch.allclose(layer.state_dict()[key], value)
+
+
+def test_gradients_flow_through_sigma():
+    torch.manual_seed(0)
+    layer = spectral_norm(nn.Linear(6, 5))
+    layer(torch.randn(1, 6))
+    # same weight and u / v on both sides, the reference in eval runs no power iteration
+    reference = torch_spectral_norm(nn.Linear(6, 5)).eval()
+    reference.load_state_dict(layer.state_dict())
+
+    x = torch.randn(4, 6)
+    layer(x).sum().backward()
+    reference(x).sum().backward()
+    assert torch.allclose(layer.weight_orig.grad, reference.weight_orig.grad, atol=1e-6)
+
+
+def test_freeze_bakes_the_normalized_weight():
+    torch.manual_seed(0)
+    layer = spectral_norm(nn.Linear(6, 5))
+    layer(torch.randn(4, 6))
+    layer.eval()
+    x = torch.randn(4, 6)
+    with torch.no_grad():
+        expected = layer(x)
+
+    freeze_spectral_norm(layer)
+    assert not layer._forward_pre_hooks
+    assert set(layer.state_dict()) == {'weight', 'bias'}
+    with torch.no_grad():
+        assert torch.allclose(layer(x), expected, atol=1e-6)